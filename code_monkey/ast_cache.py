@@ -0,0 +1,84 @@
+'''A bounded cache of parsed modules, shared by every ModuleNode in a project.
+
+ModuleNodes don't hold on to their syntax trees: they look them up here
+whenever they need them, under a key made of the module's path and a hash of
+its source. When the cache is full, the least recently used trees are dropped,
+and are parsed again (transparently) the next time they're needed.
+'''
+from collections import OrderedDict
+from threading import RLock
+
+#the default limit on the number of trees in a project's cache
+MAX_ENTRIES = 1000
+
+
+class ASTCache(object):
+    '''A least-recently-used cache of astroid modules.
+
+    Args:
+        max_entries (int): The most trees to hold at once.
+        max_source_size (int): If given, the most source (in characters) that
+                               the trees held at once may have been parsed
+                               from. A tree takes up many times the size of its
+                               source, but roughly in proportion to it, so this
+                               is a way to bound the cache's memory use.'''
+
+    def __init__(self, max_entries=MAX_ENTRIES, max_source_size=None):
+        self.max_entries = max_entries
+        self.max_source_size = max_source_size
+
+        #maps keys to (astroid_module, source_size), oldest first
+        self._entries = OrderedDict()
+        self.source_size = 0
+
+        #trees may be parsed and looked up on background threads (see
+        #background), and even get() reorders the entries
+        self._lock = RLock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        '''Return the tree stored under key, or None if there isn't one.'''
+        with self._lock:
+            entry = self._entries.pop(key, None)
+
+            if entry is None:
+                return None
+
+            #move the entry to the most recently used end
+            self._entries[key] = entry
+            return entry[0]
+
+    def add(self, key, astroid_module, source_size=0):
+        '''Store astroid_module under key, evicting older trees if the cache is
+        full.'''
+        with self._lock:
+            self.discard(key)
+
+            self._entries[key] = (astroid_module, source_size)
+            self.source_size += source_size
+
+            self._evict()
+
+    def discard(self, key):
+        '''Remove the tree stored under key, if there is one.'''
+        with self._lock:
+            entry = self._entries.pop(key, None)
+
+            if entry is not None:
+                self.source_size -= entry[1]
+
+    def _evict(self):
+        #always keep the newest entry, even if it's too big on its own
+        while len(self._entries) > 1 and (
+                len(self._entries) > self.max_entries or
+                (self.max_source_size is not None and
+                    self.source_size > self.max_source_size)):
+
+            key, (astroid_module, source_size) = self._entries.popitem(
+                last=False)
+            self.source_size -= source_size
@@ -0,0 +1,36 @@
+'''
+Backends parse the source of a module into the syntax tree that its SourceNodes
+are built from. The default, 'astroid', supports inference; 'ast' is built on
+the standard library's ast module, and is much faster and lighter, for queries
+that don't need it.
+'''
+
+from code_monkey.backend.base import Backend
+from code_monkey.backend.astroid_backend import AstroidBackend
+from code_monkey.backend.ast_backend import ASTBackend
+
+#the backends that can be chosen by name
+BACKENDS = {
+    AstroidBackend.name: AstroidBackend,
+    ASTBackend.name: ASTBackend,
+}
+
+DEFAULT_BACKEND = AstroidBackend.name
+
+#one instance of each backend is shared by every tree that uses it
+_backends = {}
+
+def get_backend(backend=DEFAULT_BACKEND):
+    '''Return the Backend named backend (or backend itself, if it's already a
+    Backend).'''
+
+    if isinstance(backend, Backend):
+        return backend
+
+    if not backend in BACKENDS:
+        raise ValueError('Unknown backend: {}'.format(backend))
+
+    if not backend in _backends:
+        _backends[backend] = BACKENDS[backend]()
+
+    return _backends[backend]
@@ -0,0 +1,546 @@
+'''A backend built on the standard library's ast module. Its trees are a thin
+layer over the ast module's own nodes, which are several times faster to build
+than astroid's and take far less memory, but can't be used for inference.
+
+The layer gives the same positions astroid would for the same source (astroid
+builds its trees from the ast module's, and adds a few rules of its own, which
+get_from_line and get_to_line follow).'''
+import ast
+
+from code_monkey.backend.base import Backend
+
+#ast nodes that are only markers, without a position in the source
+UNPOSITIONED = (
+    ast.expr_context,
+    ast.boolop,
+    ast.operator,
+    ast.unaryop,
+    ast.cmpop)
+
+#ast nodes that have a body of statements, which may begin with a docstring
+SCOPES = (ast.Module, ast.ClassDef, ast.FunctionDef)
+
+#names that astroid treats as constants, rather than as names
+CONSTANT_NAMES = {
+    'True': True,
+    'False': False,
+    'None': None
+}
+
+OPERATORS = {
+    ast.Add: '+',
+    ast.Sub: '-',
+    ast.Mult: '*',
+    ast.Div: '/',
+    ast.FloorDiv: '//',
+    ast.Mod: '%',
+    ast.Pow: '**',
+    ast.LShift: '<<',
+    ast.RShift: '>>',
+    ast.BitOr: '|',
+    ast.BitXor: '^',
+    ast.BitAnd: '&',
+    ast.And: 'and',
+    ast.Or: 'or',
+    ast.Not: 'not',
+    ast.UAdd: '+',
+    ast.USub: '-',
+    ast.Invert: '~',
+    ast.Eq: '==',
+    ast.NotEq: '!=',
+    ast.Lt: '<',
+    ast.LtE: '<=',
+    ast.Gt: '>',
+    ast.GtE: '>=',
+    ast.Is: 'is',
+    ast.IsNot: 'is not',
+    ast.In: 'in',
+    ast.NotIn: 'not in',
+}
+
+
+def has_docstring(node):
+    '''Whether the body of the scope node begins with a docstring.'''
+    return bool(node.body) and \
+        isinstance(node.body[0], ast.Expr) and \
+        isinstance(node.body[0].value, ast.Str)
+
+
+def get_body(node):
+    '''Return the statements in the body of the scope node, without its
+    docstring (which astroid doesn't count as a child).'''
+    if has_docstring(node):
+        return node.body[1:]
+
+    return node.body
+
+
+def get_from_line(node):
+    '''Return the line the ast node begins on, as astroid gives it.'''
+    if isinstance(node, ast.FunctionDef):
+        #ast gives the line of the first decorator, but astroid gives the line
+        #of the def statement
+        return node.lineno + sum(
+            get_to_line(decorator) - decorator.lineno + 1
+            for decorator in node.decorator_list)
+
+    #modules begin on line 0
+    return getattr(node, 'lineno', 0)
+
+
+def get_to_line(node, line=0):
+    '''Return the last line of the ast node, as astroid gives it: the last line
+    of its last child, or (if it has no children) the line it begins on. line
+    is used for nodes that don't have a line of their own.'''
+
+    while True:
+        if isinstance(node, SCOPES):
+            body = get_body(node)
+
+            if body:
+                node = body[-1]
+                continue
+
+            #without any statements, the last child is whatever comes before
+            #them
+            if isinstance(node, ast.ClassDef):
+                before_body = node.decorator_list + node.bases
+                if not before_body:
+                    #astroid ends the class at its docstring
+                    return node.body[0].lineno
+            elif isinstance(node, ast.FunctionDef):
+                before_body = node.args.args + node.args.defaults
+            else:
+                before_body = []
+
+            if not before_body:
+                return get_from_line(node)
+
+            node = before_body[-1]
+            continue
+
+        line = getattr(node, 'lineno', line)
+
+        last_child = None
+        for child in ast.iter_child_nodes(node):
+            if not isinstance(child, UNPOSITIONED):
+                last_child = child
+
+        if last_child is None:
+            return line
+
+        node = last_child
+
+
+def format_arguments(args, defaults):
+    default_offset = len(args) - len(defaults)
+    values = []
+
+    for index, arg in enumerate(args):
+        if isinstance(arg, ast.Tuple):
+            values.append('({})'.format(format_arguments(arg.elts, [])))
+        else:
+            values.append(arg.id)
+
+        if index >= default_offset:
+            values[-1] += '=' + as_string(defaults[index - default_offset])
+
+    return ', '.join(values)
+
+
+class SourceFormatter(object):
+    '''Formats ast expressions as source, the way astroid's as_string() does
+    (which isn't always how they were written -- binary operations get extra
+    parentheses, for example).'''
+
+    def format(self, node):
+        method = getattr(self, 'format_' + node.__class__.__name__, None)
+
+        if method is None:
+            raise NotImplementedError(
+                "Can't format {} nodes".format(node.__class__.__name__))
+
+        return method(node)
+
+    def format_list(self, nodes, separator=', '):
+        return separator.join(self.format(node) for node in nodes)
+
+    def format_Num(self, node):
+        return repr(node.n)
+
+    def format_Str(self, node):
+        return repr(node.s)
+
+    def format_Name(self, node):
+        return node.id
+
+    def format_Attribute(self, node):
+        return '{}.{}'.format(self.format(node.value), node.attr)
+
+    def format_Subscript(self, node):
+        return '{}[{}]'.format(self.format(node.value), self.format(node.slice))
+
+    def format_Index(self, node):
+        return self.format(node.value)
+
+    def format_Slice(self, node):
+        parts = [
+            self.format(part) if part else ''
+            for part in (node.lower, node.upper, node.step)]
+
+        if not parts[2]:
+            parts = parts[:2]
+
+        return ':'.join(parts)
+
+    def format_ExtSlice(self, node):
+        return self.format_list(node.dims, ',')
+
+    def format_Ellipsis(self, node):
+        return '...'
+
+    def format_Call(self, node):
+        args = [self.format(arg) for arg in node.args]
+        args.extend(self.format(keyword) for keyword in node.keywords)
+
+        if node.starargs:
+            args.append('*' + self.format(node.starargs))
+        if node.kwargs:
+            args.append('**' + self.format(node.kwargs))
+
+        return '{}({})'.format(self.format(node.func), ', '.join(args))
+
+    def format_keyword(self, node):
+        return '{}={}'.format(node.arg, self.format(node.value))
+
+    def format_Tuple(self, node):
+        if len(node.elts) == 1:
+            return '({}, )'.format(self.format(node.elts[0]))
+
+        return '({})'.format(self.format_list(node.elts))
+
+    def format_List(self, node):
+        return '[{}]'.format(self.format_list(node.elts))
+
+    def format_Set(self, node):
+        return '{{{}}}'.format(self.format_list(node.elts))
+
+    def format_Dict(self, node):
+        return '{{{}}}'.format(', '.join(
+            '{}: {}'.format(self.format(key), self.format(value))
+            for key, value in zip(node.keys, node.values)))
+
+    def format_comprehension(self, node):
+        ifs = ''.join(' if ' + self.format(test) for test in node.ifs)
+        return 'for {} in {}{}'.format(
+            self.format(node.target),
+            self.format(node.iter),
+            ifs)
+
+    def format_ListComp(self, node):
+        return '[{} {}]'.format(
+            self.format(node.elt),
+            self.format_list(node.generators, ' '))
+
+    def format_SetComp(self, node):
+        return '{{{} {}}}'.format(
+            self.format(node.elt),
+            self.format_list(node.generators, ' '))
+
+    def format_GeneratorExp(self, node):
+        return '({} {})'.format(
+            self.format(node.elt),
+            self.format_list(node.generators, ' '))
+
+    def format_DictComp(self, node):
+        return '{{{}: {} {}}}'.format(
+            self.format(node.key),
+            self.format(node.value),
+            self.format_list(node.generators, ' '))
+
+    def format_BinOp(self, node):
+        return '({}) {} ({})'.format(
+            self.format(node.left),
+            OPERATORS[node.op.__class__],
+            self.format(node.right))
+
+    def format_BoolOp(self, node):
+        return ' {} '.format(OPERATORS[node.op.__class__]).join(
+            '({})'.format(self.format(value)) for value in node.values)
+
+    def format_UnaryOp(self, node):
+        operator = OPERATORS[node.op.__class__]
+        if isinstance(node.op, ast.Not):
+            operator += ' '
+
+        return operator + self.format(node.operand)
+
+    def format_Compare(self, node):
+        return '{} {}'.format(self.format(node.left), ' '.join(
+            '{} {}'.format(OPERATORS[op.__class__], self.format(comparator))
+            for op, comparator in zip(node.ops, node.comparators)))
+
+    def format_IfExp(self, node):
+        return '{} if {} else {}'.format(
+            self.format(node.body),
+            self.format(node.test),
+            self.format(node.orelse))
+
+    def format_arguments(self, node):
+        values = [format_arguments(node.args, node.defaults)]
+
+        if node.vararg:
+            values.append('*' + node.vararg)
+        if node.kwarg:
+            values.append('**' + node.kwarg)
+
+        return ', '.join(value for value in values if value)
+
+    def format_Lambda(self, node):
+        return 'lambda {}: {}'.format(
+            self.format(node.args),
+            self.format(node.body))
+
+    def format_Repr(self, node):
+        return '`{}`'.format(self.format(node.value))
+
+    def format_Yield(self, node):
+        if node.value is None:
+            return '(yield)'
+
+        return '(yield {})'.format(self.format(node.value))
+
+
+def as_string(node):
+    '''Return the source of the ast expression node, as astroid would format
+    it.'''
+    return SourceFormatter().format(node)
+
+
+def wrap(node):
+    '''Return the ASTNode wrapping the ast node.'''
+
+    wrapper_class = WRAPPERS.get(node.__class__, ASTNode)
+
+    if wrapper_class is ASTName:
+        if isinstance(node.ctx, (ast.Store, ast.Param)):
+            wrapper_class = ASTAssName
+        elif isinstance(node.ctx, ast.Load) and node.id in CONSTANT_NAMES:
+            wrapper_class = ASTConst
+        elif not isinstance(node.ctx, ast.Load):
+            wrapper_class = ASTNode
+
+    return wrapper_class(node)
+
+
+class ASTNode(object):
+    '''Wraps a node from the ast module in the interface that SourceNodes
+    expect of a backend's trees (see Backend).'''
+
+    __slots__ = ('node',)
+
+    def __init__(self, node):
+        self.node = node
+
+    @property
+    def fromlineno(self):
+        return get_from_line(self.node)
+
+    @property
+    def tolineno(self):
+        return get_to_line(self.node, self.fromlineno)
+
+    @property
+    def col_offset(self):
+        return getattr(self.node, 'col_offset', None)
+
+    def _get_child_nodes(self):
+        for child in ast.iter_child_nodes(self.node):
+            if not isinstance(child, UNPOSITIONED):
+                yield child
+
+    def get_children(self):
+        for child in self._get_child_nodes():
+            yield wrap(child)
+
+    def as_string(self):
+        return as_string(self.node)
+
+    def _repr_name(self):
+        return getattr(self, 'name', '')
+
+
+class ASTScope(ASTNode):
+    '''Wraps a module, class, or function, whose statements are its
+    children.'''
+
+    __slots__ = ()
+
+    def _get_statements(self):
+        statements = self.node.body
+        start = 1 if has_docstring(self.node) else 0
+
+        for index in range(start, len(statements)):
+            yield wrap(statements[index])
+
+    @property
+    def body(self):
+        return list(self._get_statements())
+
+    def get_children(self):
+        return self._get_statements()
+
+
+class ASTModule(ASTScope):
+    __slots__ = ()
+
+
+class ASTClass(ASTScope):
+    __slots__ = ()
+
+    @property
+    def name(self):
+        return self.node.name
+
+    @property
+    def bases(self):
+        return [wrap(base) for base in self.node.bases]
+
+    @property
+    def basenames(self):
+        return [as_string(base) for base in self.node.bases]
+
+    def get_children(self):
+        #astroid puts the decorators first, but they're never built into nodes
+        for base in self.bases:
+            yield base
+
+        for statement in self._get_statements():
+            yield statement
+
+
+class ASTFunction(ASTScope):
+    __slots__ = ()
+
+    @property
+    def name(self):
+        return self.node.name
+
+    def get_children(self):
+        yield wrap(self.node.args)
+
+        for statement in self._get_statements():
+            yield statement
+
+
+class ASTAssign(ASTNode):
+    __slots__ = ()
+
+    @property
+    def targets(self):
+        return [wrap(target) for target in self.node.targets]
+
+    @property
+    def value(self):
+        return wrap(self.node.value)
+
+    def get_children(self):
+        for target in self.targets:
+            yield target
+
+        yield self.value
+
+
+class ASTImport(ASTNode):
+    __slots__ = ()
+
+    @property
+    def names(self):
+        return [(alias.name, alias.asname) for alias in self.node.names]
+
+
+class ASTConst(ASTNode):
+    __slots__ = ()
+
+    @property
+    def value(self):
+        if isinstance(self.node, ast.Num):
+            return self.node.n
+        if isinstance(self.node, ast.Str):
+            return self.node.s
+
+        return CONSTANT_NAMES[self.node.id]
+
+    def as_string(self):
+        return repr(self.value)
+
+    def _repr_name(self):
+        #astroid names constants after their type
+        return type(self.value).__name__
+
+
+class ASTBuiltinInstance(ASTNode):
+    '''Wraps a tuple, list, dict, or set display, which astroid names after
+    its type (so an assignment to a tuple of names is named 'tuple').'''
+
+    __slots__ = ()
+
+    @property
+    def name(self):
+        return self.node.__class__.__name__.lower()
+
+
+class ASTName(ASTNode):
+    __slots__ = ()
+
+    @property
+    def name(self):
+        return self.node.id
+
+
+class ASTAssName(ASTName):
+    __slots__ = ()
+
+
+#which ASTNode class wraps each ast class (Names are sorted out by wrap)
+WRAPPERS = {
+    ast.Module: ASTModule,
+    ast.ClassDef: ASTClass,
+    ast.FunctionDef: ASTFunction,
+    ast.Assign: ASTAssign,
+    ast.Import: ASTImport,
+    ast.Num: ASTConst,
+    ast.Str: ASTConst,
+    ast.Name: ASTName,
+    ast.Tuple: ASTBuiltinInstance,
+    ast.List: ASTBuiltinInstance,
+    ast.Dict: ASTBuiltinInstance,
+    ast.Set: ASTBuiltinInstance,
+}
+
+
+class ASTBackend(Backend):
+    '''Parses modules with the standard library's ast module.'''
+
+    name = 'ast'
+
+    def parse(self, fs_path, modpath, source):
+        #astroid adds a newline too, since compile() can fail without one
+        return ASTModule(compile(
+            source + '\n',
+            fs_path,
+            'exec',
+            ast.PyCF_ONLY_AST))
+
+    def build_node_class_mapping(self):
+        from code_monkey import node as cm_nodes
+
+        return {
+            ASTClass: cm_nodes.ClassNode,
+            ASTFunction: cm_nodes.FunctionNode,
+            ASTAssign: cm_nodes.AssignmentNode,
+            ASTImport: cm_nodes.ImportNode,
+            ASTConst: cm_nodes.ConstantNode,
+            ASTName: cm_nodes.NameNode,
+            ASTAssName: cm_nodes.AssignmentNameNode
+        }
@@ -0,0 +1,94 @@
+import codecs
+import re
+from threading import Lock
+
+from astroid.builder import AstroidBuilder
+from astroid.manager import AstroidManager
+from astroid.node_classes import Assign, Import, Const, Name, AssName
+from astroid.scoped_nodes import Class, Function
+
+from code_monkey.backend.base import Backend
+
+#a PEP 263 encoding declaration
+CODING_COMMENT = re.compile(r'^[ \t\f]*#.*?coding[:=][ \t]*([-\w.]+)')
+
+#astroid's module cache is shared by every thread, and build_astroid takes
+#modules back out of it, so only one thread builds at a time (see background)
+_build_lock = Lock()
+
+
+def get_cache_name(modpath):
+    '''Return the name astroid caches the module at modpath under (packages
+    are cached without their trailing __init__).'''
+    if modpath[-1] == '__init__':
+        modpath = modpath[:-1]
+
+    return '.'.join(modpath)
+
+
+def get_encoding(source):
+    '''Return the encoding source declares (with a byte order mark or a PEP
+    263 coding comment on one of its first two lines), or None.'''
+    if source.startswith(codecs.BOM_UTF8):
+        return 'utf-8'
+
+    for line in source.split('\n', 2)[:2]:
+        match = CODING_COMMENT.match(line)
+        if match is not None:
+            return match.group(1)
+
+    return None
+
+
+def build_astroid(fs_path, modpath, source):
+    '''Build an astroid module from source (rather than from the file at
+    fs_path), without leaving it in astroid's module cache, where it would
+    shadow the module on disk.'''
+    with _build_lock:
+        return _build_astroid(fs_path, modpath, source)
+
+
+def _build_astroid(fs_path, modpath, source):
+    manager = AstroidManager()
+    cache_name = get_cache_name(modpath)
+
+    cached_module = manager.astroid_cache.get(cache_name)
+
+    #this is what AstroidBuilder.file_build does with the text of a file.
+    #string_build can't be used, since it assumes source is UTF-8, and fails
+    #on modules with any other bytes in them (like a latin-1 comment).
+    #_data_build and _post_build are private to astroid, and file_bytes is set
+    #by file_build itself, so this relies on the astroid==1.1.1 pin in
+    #setup.py: check it against file_build before moving the pin
+    builder = AstroidBuilder(manager)
+    astroid_object = builder._data_build(source, '.'.join(modpath), fs_path)
+    astroid_object.file_bytes = source
+    astroid_object = builder._post_build(astroid_object, get_encoding(source))
+
+    if cached_module is None:
+        del manager.astroid_cache[cache_name]
+
+    return astroid_object
+
+
+class AstroidBackend(Backend):
+    '''Parses modules with astroid, whose trees support inference, but are big
+    and slow to build.'''
+
+    name = 'astroid'
+
+    def parse(self, fs_path, modpath, source):
+        return build_astroid(fs_path, modpath, source)
+
+    def build_node_class_mapping(self):
+        from code_monkey import node as cm_nodes
+
+        return {
+            Class: cm_nodes.ClassNode,
+            Function: cm_nodes.FunctionNode,
+            Assign: cm_nodes.AssignmentNode,
+            Import: cm_nodes.ImportNode,
+            Const: cm_nodes.ConstantNode,
+            Name: cm_nodes.NameNode,
+            AssName: cm_nodes.AssignmentNameNode
+        }
@@ -0,0 +1,44 @@
+class Backend(object):
+    '''Base class for parsing backends. A backend turns the source of a module
+    into a syntax tree, and says which SourceNode class each kind of tree node
+    becomes.
+
+    SourceNodes only use a small part of the tree's interface, which every
+    backend's tree nodes must provide (see the astroid backend, whose trees
+    define it):
+
+        fromlineno, tolineno, col_offset: the node's position, with lines
+                                          starting from 1
+        get_children(): the node's children, in a stable order
+        body: the statements of a class or function, without its docstring
+        name, basenames, targets, value, names: as on astroid's Class,
+                                                Function, Assign, and Import
+        as_string(): the source of an expression, as astroid formats it
+        _repr_name(): the name astroid gives a constant'''
+
+    #the name the backend is chosen by (see get_backend)
+    name = None
+
+    def __init__(self):
+        self._node_class_mapping = None
+
+    def parse(self, fs_path, modpath, source):
+        '''Return the syntax tree of the module at fs_path (whose dotted path is
+        modpath, as a list), parsed from source rather than read from the
+        file.'''
+        raise NotImplementedError()
+
+    def build_node_class_mapping(self):
+        '''Return a dictionary mapping the classes of the backend's tree nodes to
+        their SourceNode equivalents. This is a hook, and subclasses should
+        import the SourceNode classes inside it (to prevent circular
+        imports).'''
+        raise NotImplementedError()
+
+    def get_node_class_mapping(self):
+        '''The mapping from build_node_class_mapping, built the first time it's
+        asked for.'''
+        if self._node_class_mapping is None:
+            self._node_class_mapping = self.build_node_class_mapping()
+
+        return self._node_class_mapping
@@ -0,0 +1,64 @@
+'''Run code_monkey's slow operations -- reading and parsing a project, and
+diffing or committing ChangeSets -- on a pool of background threads, so that a
+program with its own event loop doesn't stall waiting on them.
+
+Every function here returns a multiprocessing AsyncResult immediately. Call
+.get() on it to wait for the result, or pass a callback, which is called (on
+a background thread) with the result once it's ready. Most event loops have a
+thread-safe way for that callback to hand the result back to the loop.
+
+A tree shouldn't be used while a background operation is still working on it.
+'''
+from multiprocessing.pool import ThreadPool
+
+from code_monkey.node_query import project_query
+
+#the number of operations that can run at once
+POOL_SIZE = 4
+
+_pool = None
+
+
+def get_pool():
+    '''Return the shared pool of background threads, starting it if needed.'''
+    global _pool
+
+    if _pool is None:
+        _pool = ThreadPool(POOL_SIZE)
+
+    return _pool
+
+
+def run_in_background(function, args=(), kwargs=None, callback=None):
+    '''Call function(*args, **kwargs) on a background thread, and return an
+    AsyncResult for its return value.'''
+    return get_pool().apply_async(function, args, kwargs or {}, callback)
+
+
+def load_query(query):
+    '''Read and parse every module under the nodes in query, so that walking
+    and searching it afterwards doesn't touch the filesystem. Return query.'''
+
+    for node in query:
+        if hasattr(node, 'iter_modules'):
+            modules = node.iter_modules()
+        else:
+            modules = [node.module]
+
+        for module in modules:
+            module.ensure_parsed()
+
+    return query
+
+
+def _load_project_query(project_path, overlay):
+    return load_query(project_query(project_path, overlay=overlay))
+
+
+def aproject_query(project_path, overlay=None, callback=None):
+    '''As project_query, but the project is read and parsed in the
+    background. The AsyncResult's value is the loaded NodeQuery.'''
+    return run_in_background(
+        _load_project_query,
+        (project_path, overlay),
+        callback=callback)
@@ -5,10 +5,8 @@ Nothing in this module actually overwrites files: that occurs in edit, where
 Changes are grouped into ChangeSets. ChangeSets check that individual changes
 do not conflict, provide diffs, and commit changes to disk.
 '''
-import difflib
-
+from code_monkey.diff import unified_diff
 from code_monkey.format import format_value
-from code_monkey.utils import line_column_to_absolute_index
 
 class Change(object):
     '''A single change to make to a single file. Replaces the file content
@@ -19,38 +17,30 @@ class Change(object):
         start (int): The index of the beginning of the region to overwrite.
         end (int): The index of the end of the region to overwrite
                    (non-inclusive).
-        new_text (str): The new text to write over the old region.'''
-    def __init__(self, path, start, end, new_text):
+        new_text (str): The new text to write over the old region.
+        snapshot (FileSnapshot): The text of the file that start and end are
+                                 positions in, if it's known. A ChangeSet
+                                 takes it as its snapshot of the file (see
+                                 ChangeSet.add), instead of reading the file
+                                 itself.'''
+    def __init__(self, path, start, end, new_text, snapshot=None):
         self.path = path
         self.start = start
         self.end = end
         self.new_text = new_text
+        self.snapshot = snapshot
 
-    def __unicode__(self):
-        with open(self.path) as source_file:
-            source = source_file.read()
-
-        new_source = (
-            source[:self.start] + self.new_text + source[self.end:])
-
-        #difflib works on lists of line strings, so we convert the source and
-        #its replacement to lists.
-        source_lines = source.splitlines(True)
-        new_lines = new_source.splitlines(True)
-
-        diff = difflib.unified_diff(
-            source_lines,
-            new_lines,
-            fromfile=self.path,
-            tofile=self.path)
+    def diff(self, source=None):
+        '''Return a diff of this change applied to source, the text of the file
+        at self.path. If source isn't given, the file is read.'''
+        if source is None:
+            with open(self.path) as source_file:
+                source = source_file.read()
 
-        output = ''
+        return unified_diff(self.path, source, [self])
 
-        #diff is a generator that returns lines, so we collect it into a string
-        for line in diff:
-            output += line
-
-        return output
+    def __unicode__(self):
+        return self.diff()
 
     def __str__(self):
         return self.__unicode__()
@@ -67,12 +57,22 @@ class ChangeGenerator(object):
     def __init__(self, node):
         self.node = node
 
+    def _change(self, start, end, new_text):
+        #the node was positioned against its module's source, so that's what
+        #the change is made against -- even if it came from the tree's overlay
+        #rather than the file
+        return Change(
+            self.node.fs_path,
+            start,
+            end,
+            new_text,
+            snapshot=self.node.module.snapshot)
+
     def overwrite(self, new_source):
         '''Generate a change that overwrites the contents of the Node entirely
         with new_source'''
 
-        return Change(
-            self.node.fs_path,
+        return self._change(
             self.node.start_index,
             self.node.end_index,
             new_source)
@@ -82,8 +82,7 @@ class ChangeGenerator(object):
         new_source. In the case of a ModuleNode, this is equivalent to
         overwrite().'''
 
-        return Change(
-            self.node.fs_path,
+        return self._change(
             self.node.body_start_index,
             self.node.body_end_index,
             new_source)
@@ -97,8 +96,7 @@ class ChangeGenerator(object):
         #find the actual index in the source at which the node begins:
         inject_index = self.node.start_index + index
 
-        return Change(
-            self.node.fs_path,
+        return self._change(
             inject_index,
             inject_index,
             inject_source)
@@ -111,20 +109,49 @@ class ChangeGenerator(object):
         #find the actual index in the source at which the node begins:
         inject_index = self.node.body_start_index + index
 
-        return Change(
-            self.node.fs_path,
+        return self._change(
             inject_index,
             inject_index,
             inject_source)
 
+    def _line_offset(self, region_start, region_end, line_index):
+        '''Return the index at which line line_index of the region of source
+        from region_start to region_end begins, relative to region_start. Like
+        line_column_to_absolute_index, but uses the LineIndex of the node's file
+        rather than searching the region for newlines.'''
+
+        if line_index < 0:
+            raise ValueError("Negative line index {} is invalid.".format(
+                line_index))
+
+        if line_index == 0:
+            return 0
+
+        file_line_index = self.node.line_index
+        region_line = file_line_index.index_to_line_column(region_start)[0]
+
+        try:
+            line_start = file_line_index.line_column_to_index(
+                region_line + line_index,
+                0)
+        except ValueError:
+            line_start = None
+
+        if line_start is None or line_start > region_end:
+            raise ValueError(
+                "Asked for line {} (0-indexed), which is past the end of "
+                "the region".format(line_index))
+
+        return line_start - region_start
+
     def inject_at_line(self, line_index, inject_source):
         '''As inject_at_index, but takes a line index instead of a character
         index.'''
 
-        character_index_of_line = line_column_to_absolute_index(
-            self.node.get_source(),
-            line_index,
-            0)
+        character_index_of_line = self._line_offset(
+            self.node.start_index,
+            self.node.end_index,
+            line_index)
 
         return self.inject_at_index(character_index_of_line, inject_source)
 
@@ -132,10 +159,10 @@ class ChangeGenerator(object):
         '''As inject_at_body_index, but takes a line index instead of a
         character index.'''
 
-        character_index_of_line = line_column_to_absolute_index(
-            self.node.get_body_source(),
-            line_index,
-            0)
+        character_index_of_line = self._line_offset(
+            self.node.body_start_index,
+            self.node.body_end_index,
+            line_index)
 
         return self.inject_at_body_index(
             character_index_of_line, inject_source)
@@ -144,10 +171,10 @@ class ChangeGenerator(object):
         '''Generate a change that inserts inject_source starting on the line
         before this node.'''
         try:
-            character_index_of_line = line_column_to_absolute_index(
-                self.node.get_file_source_code(),
-                self.node.start_line,
-                0)
+            character_index_of_line = \
+                self.node.line_index.line_column_to_index(
+                    self.node.start_line,
+                    0)
         except ValueError:
             # our node is at the beginning of its file
             # we'll need to select the first character of the file...
@@ -156,8 +183,7 @@ class ChangeGenerator(object):
             # ...and "create" a line by inserting a newline into our source
             inject_source = '\n' + inject_source
 
-        return Change(
-            self.node.fs_path,
+        return self._change(
             character_index_of_line,
             character_index_of_line,
             inject_source)
@@ -167,20 +193,19 @@ class ChangeGenerator(object):
         '''Generate a change that inserts inject_source starting on the line
         after this node.'''
         try:
-            character_index_of_line = line_column_to_absolute_index(
-                self.node.get_file_source_code(),
-                self.node.end_line + 1,
-                0)
+            character_index_of_line = \
+                self.node.line_index.line_column_to_index(
+                    self.node.end_line + 1,
+                    0)
         except ValueError:
             # our node is at the end of its file
             # we'll need to select the last character of the file...
-            character_index_of_line = len(self.node.get_file_source_code())
+            character_index_of_line = self.node.line_index.text_length
 
             # ...and "create" a line by inserting a newline into our source
             inject_source = '\n' + inject_source
 
-        return Change(
-            self.node.fs_path,
+        return self._change(
             character_index_of_line,
             character_index_of_line,
             inject_source)
@@ -244,3 +269,85 @@ class VariableChangeGenerator(ChangeGenerator):
                 value,
                 starting_indentation=self.node.outer_indentation,
                 indent_first_line=False))
+
+
+class QueryChangeGenerator(object):
+    '''Generates changes for every node in a NodeQuery at once, as its .change
+    property. Each method takes the same arguments as the ChangeGenerator
+    method of the same name, and returns a ChangeSet holding one change per
+    node.
+
+    Nodes are grouped by file: every node in a file is positioned against the
+    same text and LineIndex, and that text becomes the ChangeSet's snapshot of
+    the file, so each file is read only once. Nodes that aren't part of a
+    source file (packages and projects) are skipped.
+
+    So, a typical use might be:
+    changeset = query.change.inject_at_body_line(1, "    foobar = 42\n")'''
+
+    def __init__(self, query):
+        self.query = query
+
+    def _group_by_module(self):
+        '''Return a list of (module, nodes) pairs, sorted by file path.'''
+        modules = {}
+
+        for node in self.query:
+            try:
+                module = node.module
+            except AttributeError:
+                continue
+
+            modules.setdefault(module.fs_path, (module, []))[1].append(node)
+
+        return [modules[fs_path] for fs_path in sorted(modules.keys())]
+
+    def _generate(self, method_name, *args, **kwargs):
+        from code_monkey.edit import ChangeSet
+
+        changeset = None
+
+        for module, nodes in self._group_by_module():
+            if changeset is None:
+                #changes are made against the tree's view of the source, so a
+                #tree built on an overlay produces changes on top of it
+                changeset = ChangeSet(base=getattr(module.root, 'overlay', None))
+
+            changeset.add([
+                getattr(node.change, method_name)(*args, **kwargs)
+                for node in nodes])
+
+        if changeset is None:
+            changeset = ChangeSet()
+
+        return changeset
+
+    def overwrite(self, new_source):
+        return self._generate('overwrite', new_source)
+
+    def overwrite_body(self, new_source):
+        return self._generate('overwrite_body', new_source)
+
+    def inject_at_index(self, index, inject_source):
+        return self._generate('inject_at_index', index, inject_source)
+
+    def inject_at_body_index(self, index, inject_source):
+        return self._generate('inject_at_body_index', index, inject_source)
+
+    def inject_at_line(self, line_index, inject_source):
+        return self._generate('inject_at_line', line_index, inject_source)
+
+    def inject_at_body_line(self, line_index, inject_source):
+        return self._generate('inject_at_body_line', line_index, inject_source)
+
+    def inject_before(self, inject_source):
+        return self._generate('inject_before', inject_source)
+
+    def inject_after(self, inject_source):
+        return self._generate('inject_after', inject_source)
+
+    def inject_assignment(self, name, value, **kwargs):
+        return self._generate('inject_assignment', name, value, **kwargs)
+
+    def value(self, value):
+        return self._generate('value', value)
@@ -0,0 +1,51 @@
+'''The code_monkey command line tool.'''
+import argparse
+
+from code_monkey.backend import BACKENDS, DEFAULT_BACKEND
+from code_monkey.server import serve
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='code_monkey')
+    subparsers = parser.add_subparsers(dest='command')
+
+    serve_parser = subparsers.add_parser(
+        'serve',
+        help='keep a project in memory, and answer queries about it over a '
+             'Unix socket (see code_monkey.client)')
+    serve_parser.add_argument('project_path')
+    serve_parser.add_argument('socket_path')
+    serve_parser.add_argument(
+        '--include',
+        action='append',
+        metavar='PATTERN',
+        help='only find modules matching PATTERN (may be repeated)')
+    serve_parser.add_argument(
+        '--exclude',
+        action='append',
+        metavar='PATTERN',
+        help='skip files and directories matching PATTERN (may be repeated)')
+    serve_parser.add_argument(
+        '--gitignore',
+        action='store_true',
+        help="skip anything matched by the project's .gitignore")
+    serve_parser.add_argument(
+        '--backend',
+        choices=sorted(BACKENDS),
+        default=DEFAULT_BACKEND,
+        help='how to parse modules (default: %(default)s)')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        serve(
+            args.project_path,
+            args.socket_path,
+            include=args.include,
+            exclude=args.exclude,
+            gitignore=args.gitignore,
+            backend=args.backend)
+
+
+if __name__ == '__main__':
+    main()
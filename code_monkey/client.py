@@ -0,0 +1,175 @@
+'''A client for code_monkey.server. RemoteQuery mirrors NodeQuery, but the
+query is run by the server, against its copy of the project tree.'''
+import json
+import socket
+from StringIO import StringIO
+
+from code_monkey.edit import ChangeSet
+
+
+class ServerException(Exception):
+    '''Raised when the server couldn't answer a request.'''
+    pass
+
+
+class Connection(object):
+    '''A connection to the server listening on the Unix socket at
+    socket_path.'''
+
+    def __init__(self, socket_path):
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.connect(socket_path)
+        self._file = self.socket.makefile('rwb')
+
+    def request(self, request):
+        '''Send request (an object, which is encoded as JSON), and return the
+        result.'''
+
+        self._file.write(json.dumps(request) + '\n')
+        self._file.flush()
+
+        response = json.loads(self._file.readline())
+
+        if 'error' in response:
+            raise ServerException(response['error'])
+
+        return response['result']
+
+    def close(self):
+        self._file.close()
+        self.socket.close()
+
+
+def remote_query(socket_path):
+    '''Return a RemoteQuery containing the project served at socket_path --
+    the remote equivalent of project_query.'''
+    return RemoteQuery(Connection(socket_path))
+
+
+class RemoteQuery(object):
+    '''A query to be run by the server. Filtering a RemoteQuery returns a new
+    one, just as with NodeQuery, but nothing is sent to the server until the
+    results are needed.'''
+
+    def __init__(self, connection, operations=[]):
+        self.connection = connection
+        self.operations = operations
+
+    def _then(self, method_name, *args):
+        return RemoteQuery(
+            self.connection,
+            self.operations + [[method_name] + list(args)])
+
+    def _request(self, result, **kwargs):
+        request = {'query': self.operations, 'result': result}
+        request.update(kwargs)
+        return self.connection.request(request)
+
+    def paths(self):
+        '''Return the sorted paths of the nodes in the query.'''
+        return self._request('paths')
+
+    def sources(self):
+        '''Return a list of (path, source) pairs for the nodes in the query,
+        sorted by path.'''
+        return [tuple(pair) for pair in self._request('sources')]
+
+    def __iter__(self):
+        return iter(self.paths())
+
+    def __len__(self):
+        return len(self.paths())
+
+    @property
+    def change(self):
+        return RemoteChangeGenerator(self)
+
+    def children(self):
+        return self._then('children')
+
+    def descendents(self):
+        return self._then('descendents')
+
+    def flatten(self):
+        return self._then('flatten')
+
+    def packages(self):
+        return self._then('packages')
+
+    def modules(self):
+        return self._then('modules')
+
+    def classes(self):
+        return self._then('classes')
+
+    def functions(self):
+        return self._then('functions')
+
+    def assignments(self):
+        return self._then('assignments')
+
+    def imports(self):
+        return self._then('imports')
+
+    def constants(self):
+        return self._then('constants')
+
+    def path_contains(self, find_me):
+        return self._then('path_contains', find_me)
+
+    def source_contains(self, find_me):
+        return self._then('source_contains', find_me)
+
+    def has_child(self, find_me):
+        return self._then('has_child', find_me)
+
+    def subclass_of_name(self, find_me):
+        return self._then('subclass_of_name', find_me)
+
+
+class RemoteChangeGenerator(object):
+    '''The remote equivalent of QueryChangeGenerator. The server generates the
+    changes, and sends them back to be read into a ChangeSet, which can be
+    diffed or committed as usual.'''
+
+    def __init__(self, query):
+        self.query = query
+
+    def _generate(self, method_name, *args, **kwargs):
+        patch = self.query._request(
+            'change',
+            method=method_name,
+            args=list(args),
+            kwargs=kwargs)
+
+        return ChangeSet.read_patch(StringIO(patch))
+
+    def overwrite(self, new_source):
+        return self._generate('overwrite', new_source)
+
+    def overwrite_body(self, new_source):
+        return self._generate('overwrite_body', new_source)
+
+    def inject_at_index(self, index, inject_source):
+        return self._generate('inject_at_index', index, inject_source)
+
+    def inject_at_body_index(self, index, inject_source):
+        return self._generate('inject_at_body_index', index, inject_source)
+
+    def inject_at_line(self, line_index, inject_source):
+        return self._generate('inject_at_line', line_index, inject_source)
+
+    def inject_at_body_line(self, line_index, inject_source):
+        return self._generate('inject_at_body_line', line_index, inject_source)
+
+    def inject_before(self, inject_source):
+        return self._generate('inject_before', inject_source)
+
+    def inject_after(self, inject_source):
+        return self._generate('inject_after', inject_source)
+
+    def inject_assignment(self, name, value, **kwargs):
+        return self._generate('inject_assignment', name, value, **kwargs)
+
+    def value(self, value):
+        return self._generate('value', value)
@@ -0,0 +1,199 @@
+'''Tools for running codemods -- a query, plus changes generated from its
+results -- over a whole project at once.'''
+import os
+from multiprocessing import Pool
+from Queue import Queue
+from StringIO import StringIO
+from threading import Event, Thread
+
+from code_monkey.edit import ChangeSet
+from code_monkey.node import ProjectNode
+from code_monkey.node_query import NodeQuery
+from code_monkey.utils import StaleChangeException, stat_file
+
+#the number of modules stream_codemod reads ahead of the one it's working on
+PREFETCH_MODULES = 4
+
+
+def _as_changeset(changes):
+    '''Coerce the result of a transform (a ChangeSet, a Change, or a list of
+    Changes) to a ChangeSet.'''
+    if isinstance(changes, ChangeSet):
+        return changes
+
+    return ChangeSet(changes)
+
+
+def split_into_shards(project, shard_count):
+    '''Split the modules of project (a ProjectNode) into shard_count lists of
+    paths, balanced by file size.'''
+
+    module_sizes = sorted(
+        [(os.path.getsize(module.fs_path), module.fs_path)
+            for module in project.iter_modules()],
+        reverse=True)
+
+    shards = [[] for _ in range(shard_count)]
+    shard_sizes = [0] * shard_count
+
+    #largest modules first, each to the shard with the least source so far
+    for size, fs_path in module_sizes:
+        smallest = shard_sizes.index(min(shard_sizes))
+        shards[smallest].append(fs_path)
+        shard_sizes[smallest] += size
+
+    return [shard for shard in shards if shard]
+
+
+def run_shard(project_path, transform, module_paths):
+    '''Run transform over the modules at module_paths, and return its changes
+    as a patch (see ChangeSet.write_patch).'''
+
+    module_paths = set(module_paths)
+
+    project = ProjectNode(project_path)
+    modules = [
+        module for module in project.iter_modules()
+        if module.fs_path in module_paths]
+
+    patch = StringIO()
+    _as_changeset(transform(NodeQuery(modules))).write_patch(patch)
+
+    return patch.getvalue()
+
+
+def _run_shard_args(args):
+    #Pool.map only passes a single argument
+    return run_shard(*args)
+
+
+def run_codemod(project_path, transform, jobs=1):
+    '''Run a codemod over the project at project_path, and return a ChangeSet
+    of the results (which you can then diff or commit).
+
+    transform is called with a NodeQuery of ModuleNodes, and should return a
+    ChangeSet, a Change, or a list of Changes for those modules -- for
+    instance::
+
+        def add_foobar(modules):
+            changeset = ChangeSet()
+
+            for node in modules.flatten().classes():
+                changeset.add(
+                    node.change.inject_at_body_line(1, '    foobar = 42\\n'))
+
+            return changeset
+
+    With jobs > 1, the project's modules are split between that many worker
+    processes, and transform is called once in each (so it must be a top-level
+    function, which can be pickled). The changes from each worker are merged
+    into a single ChangeSet, so any overlapping changes will raise an
+    OverlapEditException just as they would in a single process.'''
+
+    if jobs < 1:
+        raise ValueError("jobs must be at least 1, not {}.".format(jobs))
+
+    project = ProjectNode(project_path)
+
+    if jobs == 1:
+        modules = NodeQuery(list(project.iter_modules()))
+        return _as_changeset(transform(modules))
+
+    shards = split_into_shards(project, jobs)
+
+    pool = Pool(jobs)
+    try:
+        patches = pool.map(
+            _run_shard_args,
+            [(project_path, transform, shard) for shard in shards])
+    finally:
+        pool.close()
+        pool.join()
+
+    changeset = ChangeSet()
+
+    for patch in patches:
+        changeset.merge(ChangeSet.read_patch(StringIO(patch)))
+
+    return changeset
+
+
+def _read_modules(project, queue, stop):
+    '''Put (module, source, file_stat) tuples for every module in project onto
+    queue, followed by None. Stops early once stop (an Event) is set.'''
+    try:
+        for module in project.iter_modules():
+            if stop.is_set():
+                break
+
+            #stat before reading, so that the stat can't vouch for a write we
+            #didn't see
+            file_stat = stat_file(module.fs_path)
+            with open(module.fs_path) as source_file:
+                queue.put((module, source_file.read(), file_stat))
+    finally:
+        queue.put(None)
+
+
+def stream_codemod(project_path, transform, prefetch=PREFETCH_MODULES):
+    '''Run a codemod over the project at project_path one module at a time,
+    and return the list of paths that were written.
+
+    transform is called with a NodeQuery containing a single ModuleNode, and
+    should return a ChangeSet, a Change, or a list of Changes to that module
+    (see run_codemod). Each module's changes are committed before moving on to
+    the next module, and its source and syntax tree are dropped, so memory use
+    doesn't grow with the size of the project. While one module is being
+    worked on, a background thread reads up to prefetch more from disk.
+
+    If transform or a commit raises, the background thread is stopped before
+    the exception is passed on; modules already committed stay written.'''
+
+    project = ProjectNode(project_path)
+
+    queue = Queue(maxsize=prefetch)
+    stop = Event()
+    reader = Thread(target=_read_modules, args=(project, queue, stop))
+    reader.daemon = True
+    reader.start()
+
+    written_paths = []
+    finished = False
+
+    try:
+        while True:
+            item = queue.get()
+            if item is None:
+                finished = True
+                break
+
+            module, source, file_stat = item
+
+            #the module's snapshot is taken from the source we read, so the
+            #changeset doesn't read the file again
+            module.load(source, file_stat=file_stat)
+
+            try:
+                changeset = _as_changeset(transform(NodeQuery(module)))
+
+                #the changes were made against the source we read, which might
+                #not be what's on disk by now
+                snapshot = changeset.snapshots.get(module.fs_path)
+                if snapshot is not None and \
+                        snapshot.content_hash != module.snapshot.content_hash:
+                    raise StaleChangeException(module.fs_path)
+
+                written_paths.extend(changeset.commit())
+            finally:
+                module.unload()
+    finally:
+        if not finished:
+            #the reader may be blocked on a full queue: tell it to stop, then
+            #empty the queue until it has
+            stop.set()
+            while queue.get() is not None:
+                pass
+
+        reader.join()
+
+    return written_paths
@@ -0,0 +1,179 @@
+'''Tools for rendering unified diffs of Changes.
+
+Rather than running difflib over every line of a file, we use the offsets of
+the changes themselves to cut out a small window of lines around each change,
+and only diff those windows. The cost of a diff is proportional to the number
+(and size) of the changes, not to the length of the file.
+'''
+import difflib
+from operator import attrgetter
+
+#the number of unchanged lines to show before and after each change
+CONTEXT_LINES = 3
+
+
+def _format_range(start, stop):
+    '''Format a 0-indexed, half-open line range the way unified diff hunk
+    headers expect it (1-indexed, with the length omitted when it's 1).'''
+    beginning = start + 1
+    length = stop - start
+
+    if length == 1:
+        return '{}'.format(beginning)
+
+    if not length:
+        beginning -= 1
+
+    return '{},{}'.format(beginning, length)
+
+
+def _split_lines(text):
+    '''Split text into lines, keeping the newlines. Unlike splitlines(), only
+    '\\n' ends a line, so our line numbers agree with the rest of the file.'''
+    lines = [line + '\n' for line in text.split('\n')]
+
+    #the last element is whatever followed the final newline
+    last_line = lines.pop()[:-1]
+    if last_line:
+        lines.append(last_line)
+
+    return lines
+
+
+def _line_start(source, index):
+    '''Return the index of the first character on the line containing index.'''
+    return source.rfind('\n', 0, index) + 1
+
+
+def _line_end(source, index):
+    '''Return the index after the newline that ends the line containing index
+    (or the end of source, if that line has no newline).'''
+    newline_index = source.find('\n', index)
+
+    if newline_index == -1:
+        return len(source)
+
+    return newline_index + 1
+
+
+def _expand_window(source, start, end, context_lines):
+    '''Grow the region start:end to whole lines, plus context_lines on either
+    side.'''
+
+    start = _line_start(source, start)
+    end = _line_end(source, end)
+
+    for _ in range(context_lines):
+        if start > 0:
+            start = _line_start(source, start - 1)
+
+        if end < len(source):
+            end = _line_end(source, end)
+
+    return start, end
+
+
+def get_windows(source, changes, context_lines=CONTEXT_LINES):
+    '''Group changes into windows of source that can be diffed independently.
+
+    Returns a list of (start, end, changes) tuples, where start and end are
+    character indices bounding whole lines of source. Windows whose context
+    would touch or overlap are merged, just as difflib merges nearby hunks.'''
+
+    windows = []
+
+    for change in sorted(changes, key=attrgetter('start')):
+        start, end = _expand_window(
+            source,
+            change.start,
+            change.end,
+            context_lines)
+
+        if windows and start <= windows[-1][1]:
+            last_start, last_end, last_changes = windows[-1]
+            last_changes.append(change)
+            windows[-1] = (last_start, max(last_end, end), last_changes)
+        else:
+            windows.append((start, end, [change]))
+
+    return windows
+
+
+def apply_changes(source, changes, offset=0):
+    '''Return source with changes applied. changes must be sorted by start and
+    must not overlap; offset is the index in the original file at which source
+    begins.'''
+
+    pieces = []
+    position = 0
+
+    for change in changes:
+        pieces.append(source[position:change.start - offset])
+        pieces.append(change.new_text)
+        position = change.end - offset
+
+    pieces.append(source[position:])
+
+    return ''.join(pieces)
+
+
+def unified_diff(path, source, changes, context_lines=CONTEXT_LINES):
+    '''Return a unified diff (as a string) of applying changes to source, the
+    current contents of the file at path.
+
+    The output has the same format as difflib.unified_diff, but only the lines
+    around each change are compared.'''
+
+    output = []
+
+    #the line number of window_start in the old source, and the number of lines
+    #added (or removed, if negative) by the windows we've already diffed
+    line_number = 0
+    counted_to = 0
+    line_delta = 0
+
+    for window_start, window_end, window_changes in get_windows(
+            source, changes, context_lines):
+
+        line_number += source.count('\n', counted_to, window_start)
+        counted_to = window_start
+
+        old_source = source[window_start:window_end]
+        new_source = apply_changes(old_source, window_changes, window_start)
+
+        old_lines = _split_lines(old_source)
+        new_lines = _split_lines(new_source)
+
+        matcher = difflib.SequenceMatcher(None, old_lines, new_lines)
+
+        for group in matcher.get_grouped_opcodes(context_lines):
+            if not output:
+                output.append('--- {}\n'.format(path))
+                output.append('+++ {}\n'.format(path))
+
+            first, last = group[0], group[-1]
+            output.append('@@ -{} +{} @@\n'.format(
+                _format_range(
+                    line_number + first[1],
+                    line_number + last[2]),
+                _format_range(
+                    line_number + line_delta + first[3],
+                    line_number + line_delta + last[4])))
+
+            for tag, old_start, old_end, new_start, new_end in group:
+                if tag == 'equal':
+                    for line in old_lines[old_start:old_end]:
+                        output.append(' ' + line)
+                    continue
+
+                if tag in ('replace', 'delete'):
+                    for line in old_lines[old_start:old_end]:
+                        output.append('-' + line)
+
+                if tag in ('replace', 'insert'):
+                    for line in new_lines[new_start:new_end]:
+                        output.append('+' + line)
+
+        line_delta += len(new_lines) - len(old_lines)
+
+    return ''.join(output)
@@ -1,8 +1,52 @@
 '''Tools for editing source files.'''
-import difflib
+import hashlib
+import json
+import marshal
+import os
+import shutil
+import tempfile
+from array import array
+from bisect import bisect_right
 from operator import attrgetter
 
-from code_monkey.utils import OverlapEditException
+from code_monkey.change import Change
+from code_monkey.diff import apply_changes, unified_diff
+from code_monkey.utils import (
+    OverlapEditException,
+    StaleChangeException,
+    stat_file)
+
+
+#the version of the format written by ChangeSet.write_patch, and the versions
+#that ChangeSet.read_patch understands
+PATCH_VERSION = 2
+READABLE_PATCH_VERSIONS = (1, 2)
+
+#how text that isn't UTF-8 is stored in a patch: decoded as latin-1, which maps
+#every byte to a character, so the exact bytes can be recovered
+RAW_TEXT_ENCODING = 'latin-1'
+
+
+def _to_str(text, encoding=None):
+    #json gives us unicode, but files are read (and changes made) as str
+    if isinstance(text, unicode):
+        return text.encode(encoding or 'utf-8')
+
+    return text
+
+
+def _to_json_text(text):
+    #json can only write str that's UTF-8. Return text in a form it can
+    #write, and the encoding to give _to_str to read it back (None for UTF-8)
+    if isinstance(text, unicode):
+        return text, None
+
+    try:
+        text.decode('utf-8')
+    except UnicodeDecodeError:
+        return text.decode(RAW_TEXT_ENCODING), RAW_TEXT_ENCODING
+
+    return text, None
 
 
 def changes_overlap(first_change, second_change):
@@ -27,14 +71,159 @@ def changes_overlap(first_change, second_change):
     return False
 
 
+def check_overlaps(path, sorted_changes, source=None):
+    '''Raise an OverlapEditException if any two of sorted_changes (a list of
+    changes to the file at path, sorted by start) overlap.'''
+
+    #the change reaching furthest into the file so far
+    furthest = None
+
+    for change in sorted_changes:
+        if furthest is not None and changes_overlap(furthest, change):
+            raise OverlapEditException(path, (furthest, change), source)
+
+        if furthest is None or change.end >= furthest.end:
+            furthest = change
+
+
+def hash_source(source):
+    '''Return a fingerprint of the text source.'''
+    return hashlib.sha1(source).hexdigest()
+
+
+class FileSnapshot(object):
+    '''The contents of a file at the moment a ChangeSet first saw a change to
+    it. Every Change to the file is made relative to this text, so a ChangeSet
+    uses the snapshot instead of re-reading the file, and refuses to commit if
+    the file has changed since.
+
+    Args:
+        path (str): The filesystem path of the file.
+        keep_source (bool): Whether to hold on to the text of the file. If
+                            False, only its hash is kept, and the file is read
+                            (and checked against the hash) whenever the text is
+                            needed.
+        content_hash (str): The hash of the file, if it's already known. The
+                            file isn't read until its text is needed.
+        source (str): The text of the file, if it's already been read. The
+                      file isn't read again until the snapshot is checked.
+        stat (tuple): The stat info of the file (see stat_file) from before
+                      source was read, if it was read from the file. check()
+                      doesn't read the file while this still matches.'''
+
+    def __init__(
+            self,
+            path,
+            keep_source=True,
+            content_hash=None,
+            source=None,
+            stat=None):
+        self.path = path
+
+        #stat info lets us check for changes without reading the file
+        self._stat = stat
+
+        if source is not None:
+            self.content_hash = content_hash or hash_source(source)
+            self.source = source if keep_source else None
+            return
+
+        if content_hash is not None:
+            #the snapshot was taken elsewhere (see ChangeSet.read_patch), so all
+            #we have to go on is the hash
+            self.content_hash = content_hash
+            self.source = None
+            return
+
+        self._stat = stat_file(path)
+
+        with open(path) as source_file:
+            source = source_file.read()
+
+        self.content_hash = hash_source(source)
+        self.source = source if keep_source else None
+
+    def without_source(self):
+        '''Return a copy of the snapshot that only keeps the file's hash.'''
+        return FileSnapshot(
+            self.path,
+            keep_source=False,
+            content_hash=self.content_hash,
+            stat=self._stat)
+
+    def read(self):
+        '''Return the text of the file as of the snapshot.'''
+        if self.source is not None:
+            return self.source
+
+        with open(self.path) as source_file:
+            source = source_file.read()
+
+        if hash_source(source) != self.content_hash:
+            raise StaleChangeException(self.path)
+
+        return source
+
+    def check(self):
+        '''Raise a StaleChangeException if the file no longer matches the
+        snapshot.
+
+        If the file's stat info (see stat_file) is unchanged, we take it to be
+        unchanged. Otherwise, we fall back to comparing hashes (so that, say,
+        touching a file doesn't make it stale).
+
+        That means an edit that keeps the file's size, and lands within the
+        resolution of the filesystem's timestamps of the snapshot being taken,
+        isn't noticed: on most filesystems that's nanoseconds, but it's a
+        second or two on some (like ext3, HFS+ and FAT).'''
+
+        if self._stat is not None and stat_file(self.path) == self._stat:
+            return
+
+        with open(self.path) as source_file:
+            if hash_source(source_file.read()) != self.content_hash:
+                raise StaleChangeException(self.path)
+
+
 class ChangeSet(object):
     '''A set of individual changes to make to various files. Can be previewed or
-    committed.'''
+    committed.
+
+    The first time a ChangeSet sees a change to a file, it takes a FileSnapshot
+    of that file -- or, for changes generated from nodes, uses their module's,
+    since that's the text their positions are in. If keep_sources is False,
+    only a hash of each file is kept in memory.
 
-    def __init__(self, changes=[]):
+    A ChangeSet can be layered on top of another, uncommitted ChangeSet (its
+    base). Changes are then made relative to the source as the base would leave
+    it -- which is what a tree built with the base as its overlay sees -- and
+    committing the ChangeSet commits its base as well.'''
+
+    def __init__(self, changes=[], keep_sources=True, base=None):
         self.changes = {}
+        self.snapshots = {}
+        self.keep_sources = keep_sources
+
+        #the starts of the changes to each path, in the same (sorted) order as
+        #the changes themselves (see add)
+        self._starts = {}
+        self.base = base
+
+        #the paths written by commit()
+        self.written_paths = []
+
         self.add(changes)
 
+    @property
+    def paths(self):
+        '''The set of paths changed by this ChangeSet or its base.'''
+        paths = set(self.changes.keys())
+
+        if self.base is not None:
+            paths.update(self.base.paths)
+
+        return paths
+
     def add(self, changes):
         '''Adds changes to the ChangeSet. If changes is a single change, it will
         be coerced to a list of one change (so changeset.add(my_change) is a
@@ -44,82 +233,237 @@ class ChangeSet(object):
             changes = [changes]
 
         for change in changes:
-            if not change.path in self.changes.keys():
-                self.changes[change.path] = []
+            if not change.path in self.changes:
+                self.add_snapshot(change.path, snapshot=change.snapshot)
+                self._clear_changes(change.path)
+
+            file_changes = self.changes[change.path]
+            starts = self._starts[change.path]
 
-            for old_change in self.changes[change.path]:
-                #check that our new change does not conflict (overlap) with
-                #existing changes
+            #the changes to a file are kept sorted by start, and none of them
+            #overlap, so a new change can only overlap one of the changes
+            #either side of where it goes
+            position = bisect_right(starts, change.start)
 
+            for old_change in file_changes[max(position - 1, 0):position + 1]:
                 if changes_overlap(old_change, change):
                     #changes in the same file are not allowed to touch the
                     #same lines
                     raise OverlapEditException(
                         change.path,
-                        (old_change, change))
+                        (old_change, change),
+                        self.get_source(change.path))
+
+            file_changes.insert(position, change)
+            starts.insert(position, change.start)
+
+    def _clear_changes(self, path):
+        #start (or restart) the record of changes to path
+        self.changes[path] = []
+        self._starts[path] = array('l')
+
+    def add_snapshot(self, path, source=None, snapshot=None):
+        '''Snapshot the file at path, which changes to it will be made against,
+        if it hasn't been already. If source (the text of the file) is given,
+        the file isn't read. Nor is it if snapshot (a FileSnapshot that's
+        already been taken, like a ModuleNode's) is given: it's used instead.'''
+
+        if path in self.snapshots:
+            return
 
-            self.changes[change.path].append(change)
+        if self.base is not None and path in self.base.paths:
+            #files changed by our base are checked by our base
+            return
+
+        if snapshot is None:
+            snapshot = FileSnapshot(
+                path,
+                keep_source=self.keep_sources,
+                source=source)
+        elif not self.keep_sources:
+            snapshot = snapshot.without_source()
+
+        self.snapshots[path] = snapshot
+
+    def merge(self, other):
+        '''Add every change from the ChangeSet other to this one, checking for
+        overlaps just as add() does. Neither ChangeSet may have a base.
+
+        Raises a StaleChangeException if the two ChangeSets were made against
+        different versions of the same file.'''
+
+        if self.base is not None or other.base is not None:
+            raise ValueError("ChangeSets with a base can't be merged")
+
+        for path in other.changes.keys():
+            other_snapshot = other.snapshots[path]
+
+            if not path in self.changes:
+                self.snapshots[path] = other_snapshot
+                self._clear_changes(path)
+
+            elif self.snapshots[path].content_hash != \
+                    other_snapshot.content_hash:
+                raise StaleChangeException(path)
+
+            self.add(other.get_sorted_changes(path))
+
+    def get_source(self, path):
+        '''Get the source of the file at path that this ChangeSet's changes
+        apply to: the file as of the first change to it, or the changed source
+        from our base.'''
+        if not path in self.snapshots:
+            return self.base.get_changed_source_for_path(path)
+
+        return self.snapshots[path].read()
 
     def get_changed_source_for_path(self, path):
         '''Get the source of the file at path after applying the changes in
         ChangeSet.'''
 
-        sorted_changes = sorted(self.changes[path], key=attrgetter('start'))
+        if not path in self.changes and self.base is not None:
+            return self.base.get_changed_source_for_path(path)
 
-        #offset is the number of characters to ADD to the location of the
-        #next change. It can be negative, if previous changes were smaller
-        #than the source they replaced
-        offset = 0
+        return apply_changes(
+            self.get_source(path),
+            self.get_sorted_changes(path))
 
-        #source changes with every run of the loop to reflect each separate
-        #change
-        with open(path) as read_file:
-            source = read_file.read()
+    def get_sorted_changes(self, path):
+        '''Get the changes to the file at path (not including those from our
+        base), in the order they appear in the file.'''
+        #add() keeps them in order
+        return list(self.changes.get(path, []))
 
-        for change in sorted_changes:
-            #adjust the indices to account for the offset
-            start = change.start + offset
-            end = change.end + offset
+    def get_written_changes(self, path):
+        '''Get the changes that commit() made to the file at path, sorted, or
+        None if they can't be found again. When this ChangeSet and its base
+        both change the file, for instance, their changes are made against
+        different versions of it (see ProjectNode.rebase).'''
 
-            #apply the change to source
-            source = source[:start] + change.new_text + source[end:]
+        if self.base is not None and path in self.base.paths:
+            if path in self.changes:
+                return None
 
-            #adjust offset based on the length of the change
-            old_length = change.end - change.start
-            new_length = len(change.new_text)
-            offset += new_length - old_length
+            return self.base.get_written_changes(path)
 
-        return source
+        return self.get_sorted_changes(path)
 
     def diff(self):
         '''Get a diff (as a string) of all the changes to the source encompassed
-        by this ChangeSet.'''
+        by this ChangeSet. Changes from the base are not included.'''
 
         output = 'Changes:\n\n'
 
         for path in self.changes.keys():
-            with open(path, 'r') as source_file:
-                old_source = source_file.read()
+            output += unified_diff(
+                path,
+                self.get_source(path),
+                self.get_sorted_changes(path))
 
-            new_source = self.get_changed_source_for_path(path)
+        return output
 
-            old_lines = old_source.splitlines(True)
-            new_lines = new_source.splitlines(True)
-            diff = difflib.unified_diff(
-                old_lines,
-                new_lines,
-                fromfile=path,
-                tofile=path)
+    def write_patch(self, patch_file):
+        '''Write this ChangeSet (and its base) to the file object patch_file
+        in a compact format that can be read back by read_patch.
 
-            path_diff = ''
+        The format is JSON lines: a header, then for each file a
+        {"path": ..., "hash": ...} object followed by a [start, end, new_text]
+        array for each of its changes. The hash is that of the file the changes
+        apply to (or null, if they apply on top of the base). ChangeSets layered
+        on a base follow it, each beginning with a {"layer": true} object.
 
-            for line in diff:
-                path_diff += line
+        Paths and text that aren't UTF-8 (like the source of a latin-1 module)
+        are written decoded as latin-1, and marked with its name: the file
+        object gets a "path_encoding" key, and the change array a fourth
+        element.'''
 
-            output += path_diff
+        layers = []
+        layer = self
+        while layer is not None:
+            layers.insert(0, layer)
+            layer = layer.base
 
+        patch_file.write(json.dumps({'code_monkey_patch': PATCH_VERSION}))
+        patch_file.write('\n')
 
-        return output
+        for index, layer in enumerate(layers):
+            if index > 0:
+                patch_file.write(json.dumps({'layer': True}) + '\n')
+
+            for path in layer.changes.keys():
+                snapshot = layer.snapshots.get(path)
+                json_path, path_encoding = _to_json_text(path)
+
+                path_record = {
+                    'path': json_path,
+                    'hash': snapshot.content_hash if snapshot else None,
+                }
+                if path_encoding is not None:
+                    path_record['path_encoding'] = path_encoding
+
+                patch_file.write(json.dumps(path_record))
+                patch_file.write('\n')
+
+                for change in layer.get_sorted_changes(path):
+                    new_text, encoding = _to_json_text(change.new_text)
+
+                    change_record = [change.start, change.end, new_text]
+                    if encoding is not None:
+                        change_record.append(encoding)
+
+                    patch_file.write(json.dumps(change_record))
+                    patch_file.write('\n')
+
+    @classmethod
+    def read_patch(cls, patch_file):
+        '''Read a ChangeSet written by write_patch from the file object
+        patch_file. The files it changes aren't read until they're needed, and
+        committing it raises a StaleChangeException if they don't match the
+        files the patch was made from.'''
+
+        header = json.loads(patch_file.readline())
+        if not header.get('code_monkey_patch') in READABLE_PATCH_VERSIONS:
+            raise ValueError('Not a code_monkey patch: {}'.format(header))
+
+        changeset = cls()
+        path = None
+
+        for line in patch_file:
+            record = json.loads(line)
+
+            if isinstance(record, list):
+                start, end, new_text = record[:3]
+                encoding = record[3] if len(record) > 3 else None
+
+                changeset.add(
+                    Change(path, start, end, _to_str(new_text, encoding)))
+
+            elif record.get('layer'):
+                changeset = cls(base=changeset)
+
+            else:
+                path = _to_str(record['path'], record.get('path_encoding'))
+                changeset._clear_changes(path)
+
+                if record['hash'] is not None:
+                    changeset.snapshots[path] = FileSnapshot(
+                        path,
+                        content_hash=_to_str(record['hash']))
+
+        return changeset
+
+    def patch_to_file(self, file_path):
+        '''Write self.write_patch to file_path. Any file at file_path will be
+        erased'''
+        with open(file_path, 'w') as outfile:
+            self.write_patch(outfile)
+
+    @classmethod
+    def from_patch_file(cls, file_path):
+        '''Read a ChangeSet from the patch at file_path (see
+        patch_to_file).'''
+        with open(file_path) as infile:
+            return cls.read_patch(infile)
 
     def diff_to_file(self, file_path):
         '''Write self.diff to file_path. Any file at file_path will be
@@ -127,12 +471,208 @@ class ChangeSet(object):
         with open(file_path, 'w') as outfile:
             outfile.write(self.diff())
 
+    def check(self):
+        '''Raise a StaleChangeException if any file changed by this ChangeSet
+        (or its base) has changed since its snapshot was taken.'''
+
+        for snapshot in self.snapshots.values():
+            snapshot.check()
+
+        if self.base is not None:
+            self.base.check()
+
+    def get_snapshot(self, path):
+        '''Get the FileSnapshot of the file at path as it is on disk (which may
+        belong to our base).'''
+        if not path in self.snapshots:
+            return self.base.get_snapshot(path)
+
+        return self.snapshots[path]
+
     def commit(self):
-        '''Write these changes to the filesystem.'''
+        '''Write these changes to the filesystem, and return the list of paths
+        that were written.
 
-        for path, file_changes in self.changes.items():
+        Files whose new source is identical to what's already on disk are not
+        written (so their modification times don't change).
+
+        Raises a StaleChangeException (and writes nothing) if any file has
+        changed since its snapshot was taken, or an OverlapEditException if any
+        changes overlap (see check). Files are checked by their stat info
+        before their hashes, so an edit that keeps a file's size within the
+        resolution of its timestamps can be missed (see FileSnapshot.check).
+
+        Afterwards, written_paths holds the same list, which can be used to
+        rebase a project tree (see ProjectNode.rebase).'''
+
+        self.check()
+
+        written_paths = self.written_paths = []
+
+        for path in self.paths:
 
             new_source = self.get_changed_source_for_path(path)
 
+            snapshot = self.get_snapshot(path)
+            if snapshot.source is not None:
+                unchanged = new_source == snapshot.source
+            else:
+                unchanged = hash_source(new_source) == snapshot.content_hash
+
+            if unchanged:
+                continue
+
             with open(path, 'w') as write_file:
                 write_file.write(new_source)
+
+            written_paths.append(path)
+
+        return written_paths
+
+    def adiff(self, callback=None):
+        '''As diff(), but runs in the background (see code_monkey.background),
+        and returns an AsyncResult for the diff.'''
+        from code_monkey.background import run_in_background
+
+        return run_in_background(self.diff, callback=callback)
+
+    def acommit(self, callback=None):
+        '''As commit(), but runs in the background (see code_monkey.background),
+        and returns an AsyncResult for the list of paths written.'''
+        from code_monkey.background import run_in_background
+
+        return run_in_background(self.commit, callback=callback)
+
+
+class SpillingChangeSet(ChangeSet):
+    '''A ChangeSet that keeps memory use bounded, no matter how many changes it
+    holds. Once the changes held in memory reach spill_threshold (roughly, in
+    bytes), they're written out to per-file records in a temporary directory,
+    and read back one file at a time when needed (by diff() or commit(), for
+    instance).
+
+    New changes are only checked for overlaps against the changes still in
+    memory when they're added; the rest of the check happens (in one sorted
+    sweep) when a file's changes are read back.
+
+    Snapshots still hold the text of every changed file unless keep_sources is
+    False, so pass that too if the files themselves won't fit in memory.
+
+    Call close() (or commit()) to remove the temporary directory.'''
+
+    #a rough estimate of the memory used by a Change, not counting its text
+    CHANGE_OVERHEAD = 200
+
+    def __init__(
+            self,
+            changes=[],
+            keep_sources=True,
+            base=None,
+            spill_threshold=64 * 1024 * 1024):
+
+        self.spill_threshold = spill_threshold
+        self.spill_directory = None
+        self.memory_size = 0
+
+        #the name of each path's spill file, for paths that have one
+        self._spill_files = {}
+
+        #whether any changes have been spilled, which close() removes
+        self._spilled = False
+
+        super(SpillingChangeSet, self).__init__(
+            changes=changes,
+            keep_sources=keep_sources,
+            base=base)
+
+    def add(self, changes):
+        super(SpillingChangeSet, self).add(changes)
+
+        if not isinstance(changes, list):
+            changes = [changes]
+
+        for change in changes:
+            self.memory_size += len(change.new_text) + self.CHANGE_OVERHEAD
+
+        if self.memory_size >= self.spill_threshold:
+            self.spill()
+
+    def spill(self):
+        '''Write every change held in memory out to disk.'''
+
+        if self.spill_directory is None:
+            self.spill_directory = tempfile.mkdtemp(prefix='code_monkey_')
+
+        for path, file_changes in self.changes.items():
+            if not file_changes:
+                continue
+
+            if not path in self._spill_files:
+                self._spill_files[path] = os.path.join(
+                    self.spill_directory,
+                    hashlib.sha1(path).hexdigest())
+
+            with open(self._spill_files[path], 'ab') as spill_file:
+                for change in file_changes:
+                    marshal.dump(
+                        (change.start, change.end, change.new_text),
+                        spill_file)
+
+            #keep the key, so that we still know the path has changes
+            self._clear_changes(path)
+            self._spilled = True
+
+        self.memory_size = 0
+
+    def _read_spilled_changes(self, path):
+        if not path in self._spill_files:
+            return
+
+        with open(self._spill_files[path], 'rb') as spill_file:
+            while True:
+                try:
+                    start, end, new_text = marshal.load(spill_file)
+                except EOFError:
+                    return
+
+                yield Change(path, start, end, new_text)
+
+    def get_sorted_changes(self, path):
+        file_changes = list(self._read_spilled_changes(path))
+        file_changes.extend(self.changes.get(path, []))
+        file_changes.sort(key=attrgetter('start'))
+
+        if path in self._spill_files:
+            check_overlaps(path, file_changes)
+
+        return file_changes
+
+    def get_written_changes(self, path):
+        #commit() removes any spilled changes
+        if self._spilled:
+            return None
+
+        return super(SpillingChangeSet, self).get_written_changes(path)
+
+    def check(self):
+        '''As ChangeSet.check, but also raise an OverlapEditException if any
+        changes spilled to disk overlap, which is otherwise only found when
+        they're read back.'''
+        super(SpillingChangeSet, self).check()
+
+        for path in self._spill_files.keys():
+            self.get_sorted_changes(path)
+
+    def commit(self):
+        try:
+            return super(SpillingChangeSet, self).commit()
+        finally:
+            self.close()
+
+    def close(self):
+        '''Remove any changes spilled to disk. The ChangeSet can't be used
+        afterwards.'''
+        if self.spill_directory is not None:
+            shutil.rmtree(self.spill_directory, ignore_errors=True)
+            self.spill_directory = None
+            self._spill_files = {}
@@ -1,8 +1,12 @@
+import re
 import token as token_types
 import tokenize
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
 from StringIO import StringIO
 
-from code_monkey.utils import line_column_to_absolute_index, hashabledict
+from code_monkey.utils import LineIndex
 
 UNMATCHED = "'{}' without matching {} in {}"
 
@@ -58,18 +62,219 @@ BIN_OP_TOKENS = [
     token_types.DOUBLESLASHEQUAL,
 ]
 
+#brackets, which an expression can't end inside
+OPENING_BRACKETS = frozenset(['(', '[', '{'])
+CLOSING_BRACKETS = frozenset([')', ']', '}'])
+
+#tokens that, outside of any brackets, end an expression rather than
+#continuing it
+EXPRESSION_TERMINATORS = frozenset([
+    ';', '=', ':', ',',
+    '+=', '-=', '*=', '/=', '//=', '%=', '**=',
+    '&=', '|=', '^=', '<<=', '>>=',
+    'for', 'as'
+])
+
+#tokens that end a statement (as well as ';')
+STATEMENT_END_TOKENS = frozenset([
+    token_types.NEWLINE,
+    token_types.ENDMARKER
+])
+
+#tokens that are never part of an expression's text, even inside it
+NON_CODE_TOKENS = frozenset([
+    tokenize.COMMENT,
+    tokenize.NL
+])
+
+#tokens that can come between the ':' at the end of a header and the first
+#statement of its body
+BODY_LEADING_TOKENS = NON_CODE_TOKENS | frozenset([
+    token_types.NEWLINE,
+    token_types.INDENT
+])
+
+#tokens whose text isn't code, which masked_source blanks out, and the
+#characters in them that are blanked (everything but line breaks)
+MASKED_TOKENS = frozenset([
+    token_types.STRING,
+    tokenize.COMMENT
+])
+MASKED_CHARACTERS = re.compile(r'[^\r\n]')
+
+class Token(namedtuple('Token', ['type', 'token', 'start', 'end'])):
+    '''A token: its type, its text, and its start and end (line, column)
+    positions. Fields can also be read by name with [], as with the dicts
+    tokens used to be.'''
+
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if isinstance(key, basestring):
+            return getattr(self, key)
+
+        return tuple.__getitem__(self, key)
+
+
+class TokenTable(object):
+    '''The tokens of source, found with a single pass of the tokenizer. Token
+    types, and the absolute indices of where each token starts and ends, are
+    stored in arrays (the text of a token is read back out of source when it's
+    needed).
+
+    A module builds one of these once, and shares it between all of its
+    EndDetectors.'''
+
+    def __init__(self, source, line_index=None):
+        self.source = source
+
+        if line_index is None:
+            line_index = LineIndex(source)
+        self.line_index = line_index
+
+        #built the first time it's asked for (see masked_source)
+        self._masked_source = None
+
+        self.types = array('B')
+        self.starts = array('l')
+        self.ends = array('l')
+
+        #the indices of the tokens that end statements
+        self.statement_ends = array('l')
+
+        for token in tokenize.generate_tokens(StringIO(source).readline):
+            if token[0] in STATEMENT_END_TOKENS or token[1] == ';':
+                self.statement_ends.append(len(self.types))
+
+            self.types.append(token[0])
+            self.starts.append(self._to_index(token[2]))
+            self.ends.append(self._to_index(token[3]))
+
+    def __len__(self):
+        return len(self.types)
+
+    @property
+    def masked_source(self):
+        '''source, with the text of every string and comment blanked out with
+        spaces. Newlines are kept, so indices, lines and columns are the same
+        as in source, but searching it for a character only finds code.'''
+        if self._masked_source is None:
+            pieces = []
+            code_start = 0
+
+            for index, token_type in enumerate(self.types):
+                if token_type in MASKED_TOKENS:
+                    start = self.starts[index]
+                    end = self.ends[index]
+
+                    text = self.source[start:end]
+
+                    pieces.append(self.source[code_start:start])
+                    pieces.append(MASKED_CHARACTERS.sub(' ', text))
+                    code_start = end
+
+            pieces.append(self.source[code_start:])
+            self._masked_source = ''.join(pieces)
+
+        return self._masked_source
+
+    def get_text(self, index):
+        '''Return the text of the token at index.'''
+        return self.source[self.starts[index]:self.ends[index]]
+
+    def find_before(self, source_index, text):
+        '''Return the index of the last token matching text that starts before
+        source_index (an absolute index in source), or None if there isn't
+        one.'''
+        index = bisect_left(self.starts, source_index) - 1
+
+        while index >= 0 and self.get_text(index) != text:
+            index -= 1
+
+        return index if index >= 0 else None
+
+    def find_statement_end(self, index):
+        '''Return the index of the last token of code in the statement
+        containing the token at index.'''
+        end = self.statement_ends[bisect_left(self.statement_ends, index)] - 1
+
+        while end > index and self.types[end] in NON_CODE_TOKENS:
+            end -= 1
+
+        return end
+
+    def only_comments(self, start, end):
+        '''Return whether the text of source from start to end (absolute
+        indices) holds nothing but comments, blank lines and whitespace --
+        outside of any string.'''
+        #the first token that ends after start, which may begin before it
+        index = bisect_right(self.ends, start)
+
+        while index < len(self.types) and self.starts[index] < end:
+            if not self.types[index] in NON_CODE_TOKENS:
+                return False
+
+            index += 1
+
+        return True
+
+    def find_body_start(self, source_index):
+        '''Return the index of the first token of code in the body of the class
+        or function whose header (with any decorators) starts at source_index,
+        an absolute index in source.'''
+        index = bisect_left(self.starts, source_index)
+        depth = 0
+
+        #the header ends with the first ':' outside of any brackets
+        while True:
+            text = self.get_text(index)
+
+            if text in OPENING_BRACKETS:
+                depth += 1
+            elif text in CLOSING_BRACKETS:
+                depth -= 1
+            elif text == ':' and depth == 0:
+                break
+
+            index += 1
+
+        index += 1
+        while self.types[index] in BODY_LEADING_TOKENS:
+            index += 1
+
+        return index
+
+    def _to_index(self, position):
+        #the tokenizer counts lines from 1, and may put the end marker on a
+        #line past the end of the source
+        line, column = position
+        line_starts = self.line_index.line_starts
+
+        if line > len(line_starts):
+            return self.line_index.text_length
+
+        return line_starts[line - 1] + column
+
+    def get_token(self, index, start_line=0):
+        '''Return the Token at index, with its start and end as (line, column)
+        positions counted from start_line.'''
+        start = self.starts[index]
+        end = self.ends[index]
+
+        start_position = self.line_index.index_to_line_column(start)
+        end_position = self.line_index.index_to_line_column(end)
+
+        return Token(
+            self.types[index],
+            self.source[start:end],
+            (start_position[0] - start_line, start_position[1]),
+            (end_position[0] - start_line, end_position[1]))
+
+
 def get_tokens(source):
-    '''Return an array of token dicts in source.'''
-    return [
-        hashabledict({
-            'type': token[0],
-            'token': token[1],
-            'start': (token[2][0] - 1, token[2][1]),
-            'end': (token[3][0] - 1, token[3][1]),
-        })
-        for token in
-        tokenize.generate_tokens(StringIO(source).readline)
-    ]
+    '''Return a list of the Tokens in source.'''
+    token_table = TokenTable(source)
+    return [token_table.get_token(index) for index in range(len(token_table))]
 
 def consume_parens(func):
     '''Wrap a method to consume any surrounding parens and enclosed whitespace.
@@ -82,7 +287,7 @@ def consume_parens(func):
 
         par_count = 0
 
-        while self.tokens[0]['token'] == '(':
+        while self.peek().token == '(':
             self.consume([], ['('])
             par_count += 1
             self.consume_many(WHITESPACE_TOKENS, ['\n'])
@@ -94,7 +299,7 @@ def consume_parens(func):
             self.consume([], [')'])
             par_count -= 1
 
-            if len(self.tokens) == 0:
+            if self.at_end:
                 raise ParseError(UNMATCHED.format('(', ')', self.source))
 
     return wrapped
@@ -108,19 +313,86 @@ class DetectorLockedError(Exception):
             "This EndDetector is locked and cannot consume tokens.")
 
 class EndDetector:
-
-    def __init__(self, source, child_tokens=[]):
-        self.source = source
-        self.all_tokens = get_tokens(source)
-        self.child_tokens = child_tokens
-
-        self.tokens = filter(
-            lambda token: token not in self.child_tokens,
-            self.all_tokens)
+    '''Consumes the tokens of Python source one at a time, to find where an
+    expression ends.
+
+    An EndDetector is a cursor into a TokenTable. Either give it source, which
+    it tokenizes itself, or the token_table of a larger text (like a whole
+    module) and the line of that text to begin at, so that the text only has
+    to be tokenized once, however many detectors read it. Token positions are
+    counted from start_line.'''
+
+    def __init__(
+            self,
+            source=None,
+            child_tokens=[],
+            token_table=None,
+            start_line=0):
+        if token_table is None:
+            token_table = TokenTable(source)
+
+        self.token_table = token_table
+        self.start_line = start_line
+
+        #the tokens of child nodes, which this detector skips over
+        self.child_tokens = frozenset(child_tokens)
+
+        #the absolute index of the start of start_line
+        self.base_index = token_table.line_index.line_column_to_index(
+            start_line,
+            0)
+
+        #the index in the table of the next token, beginning with the first
+        #that ends after start_line begins, and the Token at that index (once
+        #it's been built)
+        self.position = bisect_right(token_table.ends, self.base_index)
+        self._next_token = None
+        self._skip_ignored_tokens()
 
         self.consumed = []
         self.locked = False
 
+    @property
+    def source(self):
+        '''The text the detector reads, from the beginning of start_line.'''
+        return self.token_table.source[self.base_index:]
+
+    @property
+    def at_end(self):
+        return self.position >= len(self.token_table)
+
+    def peek(self):
+        '''Return the next token, without consuming it.'''
+        if self._next_token is None:
+            if self.at_end:
+                raise IndexError('No tokens left to consume')
+
+            self._next_token = self.token_table.get_token(
+                self.position,
+                self.start_line)
+
+        return self._next_token
+
+    def _advance(self, position):
+        self.position = position
+        self._next_token = None
+        self._skip_ignored_tokens()
+
+    def _skip_ignored_tokens(self):
+        #dedents are never part of an expression (and wouldn't be there at all
+        #if we'd tokenized only the expression's lines), and child tokens are
+        #left for the children to consume
+        types = self.token_table.types
+
+        while not self.at_end:
+            if types[self.position] == token_types.DEDENT:
+                self.position += 1
+            elif self.child_tokens and self.peek() in self.child_tokens:
+                self.position += 1
+                self._next_token = None
+            else:
+                break
+
 
     @property
     def last_consumed(self):
@@ -135,11 +407,12 @@ class EndDetector:
         self.locked = True
 
     def get_end_index(self, token):
-        '''Return the absolute index of the end of token in self.source.''' 
-        return line_column_to_absolute_index(
-            self.source,
-            token['end'][0],
-            token['end'][1])
+        '''Return the absolute index of the end of token in self.source.'''
+        line, column = token.end
+
+        return self.token_table.line_index.line_column_to_index(
+            self.start_line + line,
+            column) - self.base_index
 
     def consume_anything(self, discard=False):
         '''Consume the first token, no matter what it is.
@@ -151,19 +424,21 @@ class EndDetector:
         if self.locked:
             raise DetectorLockedError()
 
+        token = self.peek()
+
         if not discard:
-            self.consumed.append(self.tokens[0])
+            self.consumed.append(token)
 
-        self.tokens = self.tokens[1:]
+        self._advance(self.position + 1)
 
 
     def consume(self, types, matches=[]):
         '''Consume the first token if it's either of a type in types, or
         exactly matches a string in matches. Otherwise, raise an error.'''
 
-        token = self.tokens[0]
+        token = self.peek()
 
-        if not (token['type'] in types or token['token'] in matches):
+        if not (token.type in types or token.token in matches):
             raise ParseError("Expected type {} or match {}, but got {}".format(
                 types,
                 matches,
@@ -177,12 +452,12 @@ class EndDetector:
         number of tokens consumed.'''
 
         count = 0
-        token = self.tokens[0]
+        token = self.peek()
 
-        while token['type'] in types or token['token'] in matches:
+        while token.type in types or token.token in matches:
             self.consume(types, matches)
 
-            token = self.tokens[0]
+            token = self.peek()
             count += 1
 
         return count
@@ -191,12 +466,12 @@ class EndDetector:
         '''As consume_many, but only consumes tokens that *don't* fit a
         specified type or match string.'''
         count = 0
-        token = self.tokens[0]
+        token = self.peek()
 
-        while not token['type'] in types and not token['token'] in matches:
+        while not token.type in types and not token.token in matches:
             self.consume_anything()
 
-            token = self.tokens[0]
+            token = self.peek()
             count += 1
 
         return count
@@ -206,18 +481,18 @@ class EndDetector:
         '''Discard any tokens starting at an index before start_from. Return the
         number of tokens discarded.'''
 
-        count = 0
-        token = self.tokens[0]
+        #token starts only ever increase, so we can jump straight there
+        position = bisect_left(
+            self.token_table.starts,
+            self.base_index + start_from,
+            self.position)
 
-        while line_column_to_absolute_index(
-                self.source,
-                token['start'][0],
-                token['start'][1]) < start_from:
+        count = position - self.position
+        if count > 0:
+            if self.locked:
+                raise DetectorLockedError()
 
-            self.consume_anything(discard=True)
-            
-            token = self.tokens[0]
-            count += 1
+            self._advance(position)
 
         return count
 
@@ -245,3 +520,65 @@ class EndDetector:
         self.consume([], ['('])
         self.consume_many(WHITESPACE_TOKENS)
         self.consume([], [')'])
+
+    def consume_expression(self, allow_tuple=False):
+        '''Consume the next Python expression, of any kind, in a single pass.
+
+        The expression ends at the first token outside of any brackets it opens
+        that can't continue it: the end of the statement, a closing bracket it
+        didn't open, or a token like '=' or ':' (except a lambda's). A ',' ends
+        it too, unless allow_tuple == True, when an unbracketed tuple is
+        consumed whole. Comments and blank lines inside brackets are skipped,
+        but never consumed.'''
+
+        consumed_count = len(self.consumed)
+        depth = 0
+        lambdas = 0
+        in_backquotes = False
+        types = self.token_table.types
+
+        while not self.at_end:
+            token_type = types[self.position]
+
+            if token_type in NON_CODE_TOKENS:
+                self.consume_anything(discard=True)
+                continue
+
+            if token_type in (token_types.NEWLINE, token_types.ENDMARKER):
+                break
+
+            text = self.peek().token
+
+            if text in OPENING_BRACKETS:
+                depth += 1
+            elif text in CLOSING_BRACKETS:
+                if depth == 0:
+                    break
+                depth -= 1
+            elif text == '`':
+                #backquotes (repr) open and close with the same token
+                if in_backquotes:
+                    depth -= 1
+                else:
+                    depth += 1
+                in_backquotes = not in_backquotes
+            elif depth == 0:
+                if text == 'lambda':
+                    lambdas += 1
+                elif lambdas > 0:
+                    #a lambda's arguments (and their defaults) last until its
+                    #':'
+                    if text == ':':
+                        lambdas -= 1
+                elif text == ',' and allow_tuple:
+                    pass
+                elif text in EXPRESSION_TERMINATORS:
+                    break
+
+            self.consume_anything()
+
+        if len(self.consumed) == consumed_count:
+            raise ParseError('Expected an expression in {}'.format(self.source))
+
+        if depth > 0:
+            raise ParseError('Unclosed bracket in {}'.format(self.source))
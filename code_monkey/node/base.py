@@ -2,11 +2,19 @@ from code_monkey.change import ChangeGenerator
 from code_monkey.utils import line_column_to_absolute_index
 
 class Node(object):
-    '''Base class for all Nodes in the code_monkey project tree.'''
+    '''Base class for all Nodes in the code_monkey project tree.
+
+    Big trees can hold a lot of nodes, so every node class declares __slots__
+    rather than having a __dict__.'''
+
+    __slots__ = ('parent', 'name', '_path')
 
     def __init__(self):
         self.parent = None
 
+        #built the first time it's asked for (see path)
+        self._path = None
+
     @property
     def change(self):
         return ChangeGenerator(self)
@@ -23,6 +31,24 @@ class Node(object):
 
         return self
 
+    def get_overlay_source(self, fs_path):
+        '''Return the source of the file at fs_path with any pending changes
+        applied, or None if the file has no pending changes. Only meaningful on
+        the root of the tree (see ProjectNode).'''
+        return None
+
+    def read_source(self, fs_path):
+        '''Return the text of the file at fs_path, as the tree sees it. That's
+        the file on disk, unless the root has an overlay with pending changes to
+        it.'''
+        source = self.root.get_overlay_source(fs_path)
+
+        if source is None:
+            with open(fs_path, 'r') as source_file:
+                source = source_file.read()
+
+        return source
+
     @property
     def fs_path(self):
         #some nodes will recurse upward to find their fs_path, which is why we
@@ -31,20 +57,40 @@ class Node(object):
 
     @property
     def path(self):
-        if not hasattr(self.parent, 'path'):
-            import ipdb; ipdb.set_trace()
-        parent_path = self.parent.path
+        '''The dotted path to this node from the root of the tree. A node's name
+        and parent never change once it's built (changes to the source build new
+        nodes instead), so this is only worked out once.'''
+        if self._path is None:
+            parent_path = self.parent.path
+
+            #prevents an 'empty' root from giving us paths like '.foo.bar.baz'
+            if parent_path == '':
+                self._path = self.name
+            else:
+                self._path = parent_path + '.' + self.name
 
-        #prevents an 'empty' root from giving us paths like '.foo.bar.baz'
-        if parent_path == '':
-            return self.name
+        return self._path
 
-        return parent_path + '.' + self.name
+    @property
+    def is_stale(self):
+        '''Whether the source this node was built from has since changed. Only
+        nodes inside modules can go stale.'''
+        return False
 
-    #TODO: make nodes not __eq__ after the underlying source has changed.
-    #This would also be a good opportunity to add some kind of caching.
+    #nodes are equal if they're the same kind of node, at the same path. a stale
+    #node is never equal to a current one, even if they have the same path
     def __eq__(self, other):
-        return self.path == other.path
+        return self.__class__ is other.__class__ and \
+            self.path == other.path and \
+            self.is_stale == other.is_stale
+
+    def __ne__(self, other):
+        return not self == other
+
+    #staleness can change, so it's left out of the hash (equal nodes still
+    #always hash the same)
+    def __hash__(self):
+        return hash((self.__class__, self.path))
 
     def __unicode__(self):
         return '{}: {}'.format(
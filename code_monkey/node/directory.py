@@ -0,0 +1,159 @@
+import time
+
+from code_monkey.node.base import Node
+from code_monkey.utils import get_modules, stat_file
+
+#the kinds of event returned by DirectoryNode.refresh
+ADDED = 'added'
+REMOVED = 'removed'
+MODIFIED = 'modified'
+
+#the default number of seconds between scans in ProjectNode.watch
+WATCH_INTERVAL = 1.0
+
+
+class DirectoryNode(Node):
+    '''Shared base class for nodes that represent a directory of Python modules
+    (i.e., projects and packages).
+
+    Children are listed and built the first time they're asked for, then kept,
+    so the nodes under a directory live as long as the directory node does.'''
+
+    __slots__ = ('_children', '_listing_stat', '_fs_path')
+
+    def __init__(self):
+        super(DirectoryNode, self).__init__()
+
+        self._children = None
+
+        #the stat info of the directory when its children were listed
+        self._listing_stat = None
+
+    @property
+    def children(self):
+        '''astroid doesn't expose the children of packages in a convenient way,
+        so we use the filesystem to list them and build child nodes'''
+
+        if self._children is None:
+            self._listing_stat = stat_file(self.fs_path)
+            self._children = self._build_children()
+
+        return self._children
+
+    def _build_child(self, fs_path, is_package):
+        #imported here to prevent circular imports
+        from code_monkey.node.module import ModuleNode
+        from code_monkey.node.package import PackageNode
+
+        if is_package:
+            return PackageNode(
+                parent=self,
+                fs_path=fs_path)
+
+        return ModuleNode(
+            parent=self,
+            fs_path=fs_path)
+
+    def _get_modules(self):
+        return get_modules(self.fs_path, self.root.module_filter)
+
+    def _build_children(self):
+        children = {}
+
+        for fs_path, is_package in self._get_modules():
+            child = self._build_child(fs_path, is_package)
+            children[child.name] = child
+
+        return children
+
+    def iter_modules(self, loaded_only=False):
+        '''Yield every ModuleNode under this directory, at any depth. If
+        loaded_only is True, directories that haven't been listed yet are
+        skipped rather than read.'''
+
+        if loaded_only and self._children is None:
+            return
+
+        for child in self.children.values():
+            if isinstance(child, DirectoryNode):
+                for module in child.iter_modules(loaded_only):
+                    yield module
+            else:
+                yield child
+
+    def refresh(self):
+        '''Bring the tree under this directory up to date with the filesystem.
+
+        Directories that have been listed are listed again if they've changed,
+        and modules that have been read are parsed again if their files have
+        changed (see ModuleNode.refresh). Everything else is left alone, so the
+        cost is a stat of each file already in memory, plus the work of reading
+        whatever changed.
+
+        Return a list of (event, fs_path) tuples, where event is ADDED, REMOVED,
+        or MODIFIED.'''
+
+        if self._children is None:
+            #nothing under here has been looked at yet
+            return []
+
+        events = []
+
+        listing_stat = stat_file(self.fs_path)
+        if listing_stat != self._listing_stat:
+            self._listing_stat = listing_stat
+            events.extend(self._refresh_listing())
+
+        for child in self._children.values():
+            if isinstance(child, DirectoryNode):
+                events.extend(child.refresh())
+            elif child.refresh():
+                events.append((MODIFIED, child.fs_path))
+
+        return events
+
+    def _refresh_listing(self):
+        '''Add and remove children to match the directory's contents, and return
+        the events for the children added and removed.'''
+
+        events = []
+
+        if self._listing_stat is None:
+            #the directory itself is gone
+            listing = {}
+        else:
+            listing = dict(self._get_modules())
+
+        for name, child in self._children.items():
+            is_package = isinstance(child, DirectoryNode)
+
+            if listing.get(child.fs_path) != is_package:
+                del self._children[name]
+                events.append((REMOVED, child.fs_path))
+
+        known_paths = set(
+            child.fs_path for child in self._children.values())
+
+        for fs_path, is_package in sorted(listing.items()):
+            if not fs_path in known_paths:
+                child = self._build_child(fs_path, is_package)
+                self._children[child.name] = child
+                events.append((ADDED, fs_path))
+
+        return events
+
+    def watch(self, callback, interval=WATCH_INTERVAL, stop_event=None):
+        '''Call refresh() every interval seconds, and pass any events it returns
+        to callback, until stop_event (a threading.Event) is set. This blocks,
+        so run it on its own thread if you need to do something else.'''
+
+        while stop_event is None or not stop_event.is_set():
+            events = self.refresh()
+
+            if events:
+                callback(events)
+
+            if stop_event is None:
+                time.sleep(interval)
+            else:
+                stop_event.wait(interval)
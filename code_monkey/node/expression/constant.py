@@ -1,11 +1,14 @@
 from code_monkey.node.expression.base import ExpressionNode
 
 class ConstantNode(ExpressionNode):
-    def __init__(self, parent, astroid_object, siblings):
+    __slots__ = ('value_type',)
+
+    def __init__(self, parent, astroid_object, siblings, child_index=None):
         super(ConstantNode, self).__init__(
             parent=parent,
             astroid_object=astroid_object,
-            siblings=siblings)
+            siblings=siblings,
+            child_index=child_index)
 
         base_name = 'constant'
         self.name = base_name
@@ -18,4 +21,6 @@ class ConstantNode(ExpressionNode):
         self.value_type = astroid_object._repr_name()
 
     def consume_expression(self, detector):
-        detector.consume_constant()
+        #a constant isn't always a single token: a negative number is two, and
+        #adjacent strings are concatenated into one constant
+        detector.consume_expression()
@@ -1,9 +1,11 @@
 from code_monkey.node.expression.base import ExpressionNode
 
 class NameNode(ExpressionNode):
+    __slots__ = ()
+
     def consume_expression(self, detector):
         detector.consume_name()
 
 class AssignmentNameNode(NameNode):
     #not *really* an expression -- should it be refactored?
-    pass
+    __slots__ = ()
@@ -1,16 +1,41 @@
-from astroid.node_classes import Arguments
-
 from code_monkey.change import SourceChangeGenerator
 from code_monkey.node.source import SourceNode
-from code_monkey.utils import (
-    absolute_index_to_line_column,
-    find_termination,
-    safe_docstring)
+from code_monkey.node.span_table import UNKNOWN
+from code_monkey.utils import find_termination
+
+def get_child_after_signature(astroid_object):
+    '''Return the first astroid child of the function astroid_object that
+    isn't part of its signature, or None if its body is only a docstring.'''
+    if astroid_object.body:
+        return astroid_object.body[0]
+
+    return None
+
 
 class FunctionNode(SourceNode):
     '''Class representing a Python function or method, at the module or class
     level.'''
 
+    __slots__ = ()
+
+    def __init__(self, parent, astroid_object, siblings=[], child_index=None):
+        super(FunctionNode, self).__init__(
+            parent=parent,
+            astroid_object=astroid_object,
+            siblings=siblings,
+            child_index=child_index)
+
+        #where the first child after the signature begins is kept as our
+        #"inner" position (see SpanTable). If there isn't one, it's left
+        #UNKNOWN until it's needed (see _first_child_position). A row that
+        #already has it keeps it, since the row may have been moved since the
+        #tree was parsed (see ModuleNode.shift)
+        span_table, row = self._span_table, self._span_row
+        first_child = get_child_after_signature(astroid_object)
+        if first_child is not None and span_table.inner_line[row] == UNKNOWN:
+            span_table.inner_line[row] = first_child.fromlineno
+            span_table.inner_column[row] = first_child.col_offset
+
     @property
     def change(self):
         return SourceChangeGenerator(self)
@@ -20,58 +45,63 @@ class FunctionNode(SourceNode):
         return self.parent.fs_path
 
     @property
-    def _astroid_child_after_signature(self):
-        for child in self._astroid_object.get_children():
-            if not isinstance(child, Arguments):
-                return child
+    def _first_child_position(self):
+        span_table, row = self._span_table, self._span_row
+
+        if span_table.inner_line[row] == UNKNOWN:
+            #the body is only a docstring, so we use where that begins
+            token_table = self.module.token_table
+            docstring = token_table.find_body_start(self.start_index)
+            line, column = self.line_index.index_to_line_column(
+                token_table.starts[docstring])
+
+            span_table.inner_line[row] = line + 1
+            span_table.inner_column[row] = column
+
+        return (span_table.inner_line[row], span_table.inner_column[row])
+
+    def _find_body_start_index(self):
+        first_child_line, first_child_column = self._first_child_position
+
+        #strings and comments (like the docstring) may contain colons, so we
+        #scan the module's source with them masked out
+        masked_source = self.module.token_table.masked_source
 
-    @property
-    def body_start_index(self):
-        file_source = self.get_file_source_code()
-        first_child = self._astroid_child_after_signature
-
-        #see the safe_docstring function for details on why we do this
-        docstring = self._astroid_object.doc
-        if docstring and ':' in docstring:
-            file_source = file_source.replace(
-                docstring,
-                safe_docstring(docstring))
-
-        
         #first character AFTER the colon at the end of the signature
         after_colon_index = find_termination(
-            file_source.splitlines(True),
-            first_child.fromlineno - 1,
-            first_child.col_offset,
+            masked_source,
+            self.line_index,
+            first_child_line - 1,
+            first_child_column,
             ':')
 
         #now that we've found the colon where the function signature ends,
         #search FORWARDS for the next newline. one after that is our start
         #index
-        for newline_index, char in enumerate(file_source[after_colon_index:]):
-            if char == '\n':
-                return after_colon_index + newline_index + 1
+        newline_index = masked_source.find('\n', after_colon_index)
+        if newline_index == -1:
+            return len(masked_source)
+
+        return newline_index + 1
 
     @property
     def body_start_line(self):
-        return absolute_index_to_line_column(
-            self.get_file_source_code(),
-            self.body_start_index)[0]
+        return self.line_index.index_to_line_column(self.body_start_index)[0]
 
     @property
     def body_start_column(self):
-        return absolute_index_to_line_column(
-            self.get_file_source_code(),
-            self.body_start_index)[1]
-
+        return self.line_index.index_to_line_column(self.body_start_index)[1]
 
     @property
     def inner_indentation(self):
         '''The indentation level, as a string, of source inside this class.'''
-        lines = self.get_file_source_code().splitlines(True)
-
         #the body may begin with blank lines (which don't tell us the current
         #indentation), so instead, we use the line of the first child
-        first_child = self._astroid_child_after_signature
-        return lines[first_child.fromlineno][0:first_child.col_offset]
+        first_child_line, first_child_column = self._first_child_position
+        line_start = self.line_index.line_column_to_index(
+            first_child_line - 1,
+            0)
+
+        return self.get_file_source_code()[
+            line_start:line_start + first_child_column]
 
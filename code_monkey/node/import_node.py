@@ -7,11 +7,14 @@ from code_monkey.node.source import SourceNode
 class ImportNode(SourceNode):
     '''Node representing an import statement.'''
 
-    def __init__(self, parent, astroid_object, siblings):
+    __slots__ = ()
+
+    def __init__(self, parent, astroid_object, siblings, child_index=None):
         super(ImportNode, self).__init__(
             parent=parent,
             astroid_object=astroid_object,
-            siblings=siblings)
+            siblings=siblings,
+            child_index=child_index)
 
         base_name = astroid_object.names[0][0]
         self.name = base_name
@@ -1,34 +1,402 @@
-from astroid.manager import AstroidManager
+import tokenize
+
 from logilab.common.modutils import modpath_from_file
 
+from code_monkey.ast_cache import ASTCache
+from code_monkey.backend import get_backend
+from code_monkey.backend.astroid_backend import get_encoding
 from code_monkey.change import SourceChangeGenerator
+from code_monkey.diff import apply_changes
+from code_monkey.edit import FileSnapshot, hash_source
+from code_monkey.end_detection import TokenTable
 from code_monkey.node.source import SourceNode
+from code_monkey.node.span_table import ShiftMap, SpanTable
+from code_monkey.utils import LineIndex, stat_file
+
+
+def is_comment_text(text):
+    '''Return whether text is whole lines of nothing but comments and
+    whitespace.'''
+    if text and not text.endswith('\n'):
+        return False
+
+    try:
+        return TokenTable(text).only_comments(0, len(text))
+    except (tokenize.TokenError, IndentationError):
+        return False
+
 
 class ModuleNode(SourceNode):
-    '''Node representing a module (a single Python source file).'''
+    '''Node representing a module (a single Python source file).
+
+    The module's syntax tree isn't kept on the node: it's parsed when it's
+    first needed, and kept in the project's ASTCache, which may drop it again
+    (in which case it's parsed again, from the same source, when it's next
+    needed).
+
+    The tree is parsed by the tree's Backend (see ProjectNode), which is
+    astroid unless another was chosen.'''
+
+    __slots__ = (
+        'parse_version',
+        '_own_ast_cache',
+        '_fs_path',
+        '_line_span',
+        '_source',
+        '_source_hash',
+        '_line_index',
+        '_token_table',
+        '_snapshot',
+        '_spans',
+        '_file_stat',
+        '_modpath',
+    )
 
     def __init__(self, parent, fs_path):
-        astroid_object = AstroidManager().ast_from_file(fs_path)
+        #how many times the module's source has been replaced (see
+        #SourceNode.is_stale)
+        self.parse_version = 0
+
+        #a private cache, used only if the tree has no shared one
+        self._own_ast_cache = None
 
         super(ModuleNode, self).__init__(
             parent=parent,
-            astroid_object=astroid_object)
+            astroid_object=None)
 
         self._fs_path = fs_path
 
+        #the first and last lines of the module, as astroid reports them
+        self._line_span = None
+
+        #the text of the module, once it has been read, its hash, and its
+        #LineIndex
+        self._source = None
+        self._source_hash = None
+        self._line_index = None
+
+        #the TokenTable of the module, shared by the EndDetectors of its
+        #expressions
+        self._token_table = None
+
+        #the FileSnapshot of the source, once it's been asked for
+        self._snapshot = None
+
+        #the SpanTable for the nodes built from the current parse
+        self._spans = None
+
+        #the stat info of the file when it was first read, so that refresh()
+        #can tell if it's changed since
+        self._file_stat = None
+
         #gets the module name -- the whole return value of modpath_from_file
         #is a list containing each element of the dotpath
-        self.name = modpath_from_file(fs_path)[-1]
+        self._modpath = modpath_from_file(fs_path)
+        self.name = self._modpath[-1]
+
+    @property
+    def _ast_cache(self):
+        ast_cache = getattr(self.root, 'ast_cache', None)
+
+        if ast_cache is None:
+            if self._own_ast_cache is None:
+                self._own_ast_cache = ASTCache(max_entries=1)
+
+            ast_cache = self._own_ast_cache
+
+        return ast_cache
+
+    @property
+    def backend(self):
+        '''The Backend the module is parsed with.'''
+        return getattr(self.root, 'backend', None) or get_backend()
+
+    @property
+    def _cache_key(self):
+        if self._source_hash is None:
+            self._source_hash = hash_source(self.get_file_source_code())
+
+        #trees from different backends can't stand in for each other
+        return (self.fs_path, self._source_hash, self.backend.name)
+
+    @property
+    def _astroid_object(self):
+        #we don't parse the module until something needs its contents, so that
+        #walking the tree is cheap
+        return self.ensure_parsed()
+
+    @_astroid_object.setter
+    def _astroid_object(self, astroid_object):
+        #SourceNode.__init__ sets this to None -- the tree itself lives in the
+        #AST cache
+        pass
+
+    def ensure_parsed(self):
+        '''Parse the module, unless its syntax tree is already in the AST cache,
+        and return the tree.'''
+        key = self._cache_key
+        astroid_module = self._ast_cache.get(key)
+
+        if astroid_module is None:
+            source = self.get_file_source_code()
+            astroid_module = self.backend.parse(
+                self.fs_path,
+                self._modpath,
+                source)
+            self._ast_cache.add(key, astroid_module, len(source))
+
+        if self._line_span is None:
+            self._line_span = (astroid_module.fromlineno, astroid_module.tolineno)
+
+        return astroid_module
+
+    @property
+    def is_parsed(self):
+        '''Whether the module's syntax tree is currently in memory.'''
+        return self._source is not None and self._cache_key in self._ast_cache
+
+    @property
+    def is_stale(self):
+        #the ModuleNode itself always reflects the latest parse
+        return False
+
+    def _forget_source(self):
+        if self._source_hash is not None:
+            self._ast_cache.discard(self._cache_key)
+
+        self._source = None
+        self._source_hash = None
+        self._line_index = None
+        self._token_table = None
+        self._snapshot = None
+        self._file_stat = None
+        self._line_span = None
+        self._spans = None
+        self._children = None
+        self.parse_version += 1
+
+    def reparse(self):
+        '''Parse the module again, after its source has changed. The ModuleNode
+        itself stays valid, but nodes built from the old parse become stale (see
+        SourceNode.is_stale).'''
+
+        self._forget_source()
+        self.ensure_parsed()
+
+    def shift(self, changes, source_hash):
+        '''Apply changes (sorted, and made against the source whose hash is
+        source_hash) to the module's source, and move the positions of its
+        nodes to match, without parsing it again. The nodes stay valid.
+
+        That's only possible if changes can't alter the syntax tree: they must
+        replace whole lines holding only comments and blank lines with others.
+        If they don't, or the module's source isn't the one they were made
+        against, nothing is done, and False is returned (and the module should
+        be re-parsed instead).'''
+
+        if self._source is None:
+            return False
+
+        #(path, source hash, backend name)
+        old_key = self._cache_key
+        if old_key[1] != source_hash:
+            return False
+
+        source = self._source
+        line_index = self.line_index
+        line_regions = []
+        index_regions = []
+
+        for change in changes:
+            if not self._is_comment_region(change.start, change.end):
+                return False
+
+            if not is_comment_text(change.new_text):
+                return False
+
+            line_regions.append((
+                line_index.index_to_line_column(change.start)[0],
+                line_index.index_to_line_column(change.end)[0],
+                change.new_text.count('\n')))
+            index_regions.append((
+                change.start,
+                change.end,
+                len(change.new_text)))
+
+        new_source = apply_changes(source, changes)
+
+        #the encoding is declared in a comment, which may have changed
+        if get_encoding(new_source) != get_encoding(source):
+            return False
+
+        line_map = ShiftMap(line_regions)
+
+        if self._spans is not None:
+            self._spans.shift(line_map, ShiftMap(index_regions))
+
+        if self._line_span is not None:
+            self._line_span = (
+                self._line_span[0],
+                line_map.map_line(self._line_span[1]))
+
+        #the tree is still right for the new source (its positions are out of
+        #date, but we only use the SpanTable's), so it's cached under the new
+        #source's key
+        astroid_module = self._ast_cache.get(old_key)
+        self._ast_cache.discard(old_key)
+
+        self._source = new_source
+        self._source_hash = None
+        self._line_index = None
+        self._token_table = None
+        self._snapshot = None
+        self._file_stat = stat_file(self.fs_path)
+
+        if astroid_module is not None:
+            self._ast_cache.add(self._cache_key, astroid_module, len(new_source))
+
+        return True
+
+    def _is_comment_region(self, start, end):
+        #whether the source from start to end is whole lines of only comments
+        #and blank lines, which don't follow a backslash continuation
+        source = self._source
+
+        if start > 0 and source[start - 1] != '\n':
+            return False
+
+        if end > 0 and end < len(source) and source[end - 1] != '\n':
+            return False
+
+        if source.endswith('\\\n', 0, start) or \
+                source.endswith('\\\r\n', 0, start):
+            return False
+
+        return self.token_table.only_comments(start, end)
+
+    def load(self, source, file_stat=None):
+        '''Parse the module from source, which has already been read from its
+        file. file_stat (see stat_file) is the stat of the file taken before
+        it was read; if it isn't given, the file is stat'ed now.'''
+
+        self._forget_source()
+        self._file_stat = file_stat
+        self._record_stat()
+        self._source = source
+        self.ensure_parsed()
+
+    def unload(self):
+        '''Drop the module's source and syntax tree. They'll be read and parsed
+        again if they're needed.'''
+
+        self._forget_source()
+
+    def refresh(self):
+        '''Parse the module again if its file has changed since it was read,
+        and return whether it had. Modules that haven't been read yet are left
+        alone, since they'll be read fresh when they're needed.'''
+
+        if self._file_stat is None:
+            return False
+
+        if stat_file(self.fs_path) == self._file_stat:
+            return False
+
+        was_parsed = self.is_parsed
+        self._forget_source()
+
+        if was_parsed:
+            self.ensure_parsed()
+
+        return True
+
+    def _record_stat(self):
+        if self._file_stat is None:
+            self._file_stat = stat_file(self.fs_path)
+
+    def get_file_source_code(self):
+        #the text is read once, and shared by every node in the module
+        if self._source is None:
+            self._record_stat()
+            self._source = self.read_source(self.fs_path)
+
+        return self._source
+
+    @property
+    def span_table(self):
+        '''The SpanTable holding the positions of the nodes in this module.'''
+        if self._spans is None:
+            self._spans = SpanTable()
+
+        return self._spans
+
+    @property
+    def line_index(self):
+        if self._line_index is None:
+            self._line_index = LineIndex(self.get_file_source_code())
+
+        return self._line_index
+
+    @property
+    def token_table(self):
+        '''The TokenTable of the module's source, which is only tokenized
+        once.'''
+        if self._token_table is None:
+            self._token_table = TokenTable(
+                self.get_file_source_code(),
+                self.line_index)
+
+        return self._token_table
+
+    @property
+    def snapshot(self):
+        '''A FileSnapshot of the source the module was parsed from, which the
+        changes generated for its nodes are made against (see ChangeSet.add).
+
+        If that source came from the tree's overlay, committing changes made
+        against it raises a StaleChangeException, unless the overlay is the
+        ChangeSet's base.'''
+        if self._snapshot is None:
+            source = self.get_file_source_code()
+
+            #the stat of the file only vouches for the source if it was read
+            #from the file
+            file_stat = self._file_stat
+            overlay = getattr(self.root, 'overlay', None)
+            if overlay is not None and self.fs_path in overlay.paths:
+                file_stat = None
+
+            self._snapshot = FileSnapshot(
+                self.fs_path,
+                content_hash=self._cache_key[1],
+                source=source,
+                stat=file_stat)
+
+        return self._snapshot
+
+    @property
+    def module(self):
+        return self
 
     @property
     def change(self):
         return SourceChangeGenerator(self)
 
+    def _get_line_span(self):
+        if self._line_span is None:
+            self.ensure_parsed()
+
+        return self._line_span
+
     @property
     def start_line(self):
         #for modules, astroid gives 0 as the start line -- so we don't want to
         #subtract 1
-        return self._astroid_object.fromlineno
+        return self._get_line_span()[0]
+
+    @property
+    def end_line(self):
+        return self._get_line_span()[1]
 
     @property
     def start_column(self):
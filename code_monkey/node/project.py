@@ -1,16 +1,51 @@
 from logilab.common.modutils import modpath_from_file
 
-from code_monkey.node.base import Node
-from code_monkey.node.module import ModuleNode
-from code_monkey.node.package import PackageNode
-from code_monkey.utils import get_modules
+from code_monkey.ast_cache import ASTCache
+from code_monkey.backend import DEFAULT_BACKEND, get_backend
+from code_monkey.node.directory import DirectoryNode
+from code_monkey.utils import ModuleFilter
 
-class ProjectNode(Node):
+class ProjectNode(DirectoryNode):
     '''Node representing an entire Python project. The project root may or may
     not be a package, but it must exist within the Python path of the current
-    environment.'''
+    environment.
 
-    def __init__(self, project_path):
+    If overlay (a ChangeSet) is given, the tree is built from the source files
+    as they would be after committing it.
+
+    include, exclude, and gitignore control which files and directories are
+    searched for modules (see ModuleFilter).
+
+    The syntax trees of the project's modules are kept in ast_cache (an
+    ASTCache). If it isn't given, a cache with the default limits is used.
+
+    If lite is True, nodes inside modules don't hold on to their astroid
+    objects, which takes much less memory for big trees (see
+    SourceNode.is_lite).
+
+    backend is the name of the Backend to parse modules with: 'astroid' (the
+    default), or 'ast', which is much faster, and uses much less memory, but
+    doesn't support inference.'''
+
+    __slots__ = (
+        'scope',
+        'overlay',
+        'module_filter',
+        'ast_cache',
+        'lite',
+        'backend',
+    )
+
+    def __init__(
+            self,
+            project_path,
+            overlay=None,
+            include=None,
+            exclude=None,
+            gitignore=False,
+            ast_cache=None,
+            lite=False,
+            backend=DEFAULT_BACKEND):
         super(ProjectNode, self).__init__()
 
         #gets the python 'dotpath' of the project root. If the project root
@@ -23,28 +58,67 @@ class ProjectNode(Node):
         #the file system (not python) path to the project
         self._fs_path = project_path
 
-    @property
-    def children(self):
-        '''astroid doesn't expose the children of packages in a convenient way,
-        so we the filesystem to list them and build child nodes'''
-
-        fs_children = get_modules(self.fs_path)
-
-        children = {}
-
-        for fs_path, is_package in fs_children:
-            if is_package:
-                child = PackageNode(
-                    parent=self,
-                    fs_path=fs_path)
-                children[child.name] = child
-            else:
-                child = ModuleNode(
-                    parent=self,
-                    fs_path=fs_path)
-                children[child.name] = child
-
-        return children
+        self.overlay = overlay
+
+        if ast_cache is None:
+            ast_cache = ASTCache()
+        self.ast_cache = ast_cache
+        self.lite = lite
+        self.backend = get_backend(backend)
+
+        #which files and directories are searched for modules
+        self.module_filter = None
+        if include or exclude or gitignore:
+            self.module_filter = ModuleFilter(
+                project_path,
+                include=include,
+                exclude=exclude,
+                gitignore=gitignore)
+
+    def get_overlay_source(self, fs_path):
+        if self.overlay is None or not fs_path in self.overlay.paths:
+            return None
+
+        return self.overlay.get_changed_source_for_path(fs_path)
+
+    def rebase(self, changeset):
+        '''Bring the tree up to date after changeset has been committed.
+
+        Only modules that changeset wrote to are touched -- everything else in
+        the tree (including packages that have already been listed) is kept as
+        it is. Modules whose changes only replaced comments and blank lines
+        keep their nodes, which are shifted to their new positions (see
+        ModuleNode.shift). Any other module that was written is parsed again.
+        Return the list of ModuleNodes that were re-parsed.'''
+
+        #if we were looking at changeset (or one of its bases) as an overlay,
+        #its changes are now on disk
+        layer = changeset
+        while layer is not None:
+            if layer is self.overlay:
+                self.overlay = None
+                break
+
+            layer = layer.base
+
+        written_paths = set(changeset.written_paths)
+        reparsed = []
+
+        for module in self.iter_modules(loaded_only=True):
+            fs_path = module.fs_path
+            if not fs_path in written_paths:
+                continue
+
+            changes = changeset.get_written_changes(fs_path)
+            if changes is not None and module.shift(
+                    changes,
+                    changeset.get_snapshot(fs_path).content_hash):
+                continue
+
+            module.reparse()
+            reparsed.append(module)
+
+        return reparsed
 
     @property
     def path(self):
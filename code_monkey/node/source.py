@@ -1,45 +1,53 @@
 import logging
 
-from astroid.node_classes import Assign, Import, Const, Dict, Name, AssName
-from astroid.scoped_nodes import Class, Function
-
 from code_monkey.change import SourceChangeGenerator
 from code_monkey.node.base import Node
-from code_monkey.utils import (
-    line_column_to_absolute_index,
-    count_lines)
+from code_monkey.node.span_table import UNKNOWN
 
 logger = logging.getLogger(__name__)
 
-def get_node_class_mapping():
-    '''Return a dictionary mapping astroid classes to their corresponding
-    SourceNode equivalent.
-
-    We do this in a function so that we can delay importing the other SourceNode
-    classes (thereby preventing circular imports).'''
-
-    from code_monkey import node as cm_nodes
-
-    return {
-        Class: cm_nodes.ClassNode,
-        Function: cm_nodes.FunctionNode,
-        Assign: cm_nodes.AssignmentNode,
-        Import: cm_nodes.ImportNode,
-        Const: cm_nodes.ConstantNode,
-        Name: cm_nodes.NameNode,
-        AssName: cm_nodes.AssignmentNameNode
-    }
-
 class SourceNode(Node):
     '''Shared base class for all nodes that represent code inside a single
     file (i.e., module or lower).'''
 
-    def __init__(self, parent, astroid_object, siblings=[]):
+    __slots__ = (
+        '_astroid_node',
+        '_parse_version',
+        '_child_index',
+        '_children',
+        '_span_table',
+        '_span_row',
+    )
+
+    def __init__(self, parent, astroid_object, siblings=[], child_index=None):
         super(SourceNode, self).__init__()
 
         self.parent = parent
         self._astroid_object = astroid_object
 
+        #which parse of the module this node was built from (see is_stale)
+        self._parse_version = self.module.parse_version
+
+        #the position of the astroid object among its parent's children, so
+        #that it can be found again after it's been released (see is_lite)
+        self._child_index = child_index
+
+        #the children of a lite node, which are built once and kept
+        self._children = None
+
+        #our position is kept in a row of the module's SpanTable, so we don't
+        #need astroid to find it
+        self._span_table = None
+        self._span_row = None
+
+        if astroid_object is not None:
+            self._span_table = self.module.span_table
+            self._span_row = self._span_table.get_row(
+                (parent._span_row, child_index),
+                astroid_object.fromlineno,
+                astroid_object.tolineno,
+                astroid_object.col_offset)
+
         try:
             self.name = astroid_object.name
         except AttributeError:
@@ -48,6 +56,33 @@ class SourceNode(Node):
             #method
             pass
 
+    @property
+    def _astroid_object(self):
+        if self._astroid_node is None:
+            #a lite node has let go of its astroid object, so we find it again
+            #in a parse of the module (which isn't kept)
+            parent_object = self.parent._astroid_object
+            return list(parent_object.get_children())[self._child_index]
+
+        return self._astroid_node
+
+    @_astroid_object.setter
+    def _astroid_object(self, astroid_object):
+        self._astroid_node = astroid_object
+
+    @property
+    def is_lite(self):
+        '''Whether this node belongs to a lite tree (see ProjectNode). Lite nodes
+        copy what they need out of astroid when they're built, then release
+        their astroid objects, which are only found again (by parsing the
+        module) if something asks for them.'''
+        return self.root.lite
+
+    def _release_astroid(self):
+        '''Copy out anything else this node needs from its astroid object, then
+        drop the reference to it.'''
+        self._astroid_node = None
+
     @property
     def change(self):
         return SourceChangeGenerator(self)
@@ -55,7 +90,18 @@ class SourceNode(Node):
     @property
     def fs_path(self):
         return self.parent.fs_path
-    
+
+    @property
+    def module(self):
+        '''The ModuleNode containing this node.'''
+        return self.parent.module
+
+    @property
+    def is_stale(self):
+        '''Whether this node was built from a parse of its module that has
+        since been replaced (see ModuleNode.reparse).'''
+        return self._parse_version != self.module.parse_version
+
     def get_source_file(self):
         '''return a read-only file object for the file in which this Node was
         defined. only meaningful at or below the module level -- higher than
@@ -71,7 +117,7 @@ class SourceNode(Node):
     @property
     def start_line(self):
         #astroid gives line numbers starting with 1
-        return self._astroid_object.fromlineno - 1
+        return self._span_table.from_line[self._span_row] - 1
 
     @property
     def body_start_line(self):
@@ -81,7 +127,7 @@ class SourceNode(Node):
     @property
     def end_line(self):
         #astroid gives line numbers starting with 1
-        return self._astroid_object.tolineno
+        return self._span_table.to_line[self._span_row]
 
     @property
     def body_end_line(self):
@@ -90,7 +136,7 @@ class SourceNode(Node):
 
     @property
     def start_column(self):
-        return self._astroid_object.col_offset
+        return self._span_table.column[self._span_row]
 
     @property
     def body_start_column(self):
@@ -106,75 +152,94 @@ class SourceNode(Node):
         return self.end_column
 
 
+    def _get_span(self, column_name, find):
+        '''Return this node's value in the index column column_name of its
+        SpanTable, calling find() to work it out the first time.'''
+
+        if self._span_row is None:
+            return find()
+
+        column = getattr(self._span_table, column_name)
+        value = column[self._span_row]
+
+        if value == UNKNOWN:
+            value = find()
+
+            if value is not None:
+                column[self._span_row] = value
+
+        return value
+
     @property
     def start_index(self):
         '''The character index of the beginning of the node, relative to the
         entire source file.'''
-        return line_column_to_absolute_index(
-            self.get_file_source_code(),
-            self.start_line,
-            self.start_column)
+        return self._get_span('start_index', self._find_start_index)
 
     @property
     def end_index(self):
         '''The character index of the character after the end of the node,
         relative to the entire source file.'''
-        if self.end_line == count_lines(self.get_file_source_code()) + 1:
-            # we're on the last line
-            # the "next index" doesn't really exist -- it's the end of the file
-            # + 1
-            return len(self.get_file_source_code()) 
-
-        return line_column_to_absolute_index(
-            self.get_file_source_code(),
-            self.end_line,
-            self.end_column)
+        return self._get_span('end_index', self._find_end_index)
 
     @property
     def body_start_index(self):
         '''The character index of the beginning of the node body, relative to
         the entire source file.'''
-        return line_column_to_absolute_index(
-            self.get_file_source_code(),
-            self.body_start_line,
-            self.body_start_column)
+        return self._get_span('body_start_index', self._find_body_start_index)
 
     @property
     def body_end_index(self):
         '''The character index of the character after the end of the node body,
         relative to the entire source file.'''
-        if self.body_end_line == count_lines(self.get_file_source_code()) + 1:
+        return self._get_span('body_end_index', self._find_body_end_index)
+
+    def _find_start_index(self):
+        return self.line_index.line_column_to_index(
+            self.start_line,
+            self.start_column)
+
+    def _find_end_index(self):
+        return self._line_column_to_end_index(
+            self.end_line,
+            self.end_column)
+
+    def _find_body_start_index(self):
+        return self.line_index.line_column_to_index(
+            self.body_start_line,
+            self.body_start_column)
+
+    def _find_body_end_index(self):
+        return self._line_column_to_end_index(
+            self.body_end_line,
+            self.body_end_column)
+
+    def _line_column_to_end_index(self, line, column):
+        line_index = self.line_index
+
+        if line == line_index.newline_count + 1:
             # we're on the last line
             # the "next index" doesn't really exist -- it's the end of the file
             # + 1
-            return len(self.get_file_source_code())
+            return line_index.text_length
+
+        return line_index.line_column_to_index(line, column)
 
-        return line_column_to_absolute_index(
-            self.get_file_source_code(),
-            self.body_end_line,
-            self.body_end_column)
- 
     def _get_source_region(self, start_index, end_index):
         '''return a substring of the source code starting from start_index up to
         but not including end_index'''
 
-        with open(self.fs_path, 'r') as source_file:
-
-            if not source_file:
-                return None
-
-            source = source_file.read()
-            source = source[start_index:end_index]
-
-            return source
+        return self.get_file_source_code()[start_index:end_index]
 
     def get_file_source_code(self):
         '''Return the text of the entire file containing Node.'''
-        with open(self.fs_path, 'r') as source_file:
-            if not source_file:
-                return None
+        return self.module.get_file_source_code()
 
-            return source_file.read()
+    @property
+    def line_index(self):
+        '''The LineIndex of the file containing Node, shared by every node in
+        the module.'''
+        return self.module.line_index
 
     def get_source(self):
         '''return a string of the source code the Node represents'''
@@ -199,26 +264,50 @@ class SourceNode(Node):
         lines = self.get_file_source_code().splitlines(True)
         return lines[self.start_line][0:self.start_column]
 
-    @property
-    def children(self):
-        #all of the children found by astroid:
+    def _build_children(self):
+        #all of the children found by the backend (astroid, unless another was
+        #chosen):
 
         astroid_children = self._astroid_object.get_children()
+        node_class_mapping = self.module.backend.get_node_class_mapping()
         children = {}
 
-        for child in astroid_children:
+        for child_index, child in enumerate(astroid_children):
 
             try:
-                code_monkey_class = get_node_class_mapping()[child.__class__]
+                code_monkey_class = node_class_mapping[child.__class__]
                 child_node = code_monkey_class(
                     parent=self,
                     astroid_object=child,
-                    siblings=children)
+                    siblings=children,
+                    child_index=child_index)
 
                 children[child_node.name] = child_node
 
             except KeyError:
-                #there's no equivalent to this astroid class in code_monkey yet
+                #there's no equivalent to this class in code_monkey yet
                 logger.debug('AST node omitted: ' + str(child))
 
         return children
+
+    def _build_lite_children(self):
+        #a lite node builds its whole subtree at once, while the astroid
+        #objects are at hand, and keeps it
+        children = self._build_children()
+
+        for child in children.values():
+            child._build_lite_children()
+            child._release_astroid()
+
+        self._children = children
+        return children
+
+    @property
+    def children(self):
+        if self._children is not None:
+            return self._children
+
+        if self.is_lite:
+            return self._build_lite_children()
+
+        return self._build_children()
@@ -0,0 +1,131 @@
+from array import array
+from bisect import bisect_left, bisect_right
+
+#the value of a span that hasn't been worked out yet
+UNKNOWN = -1
+
+
+class ShiftMap(object):
+    '''Maps positions in a text to where they are after some regions of it
+    have been replaced. regions is a sorted list of non-overlapping (start,
+    end, new_length) tuples, which can be in characters or in lines.'''
+
+    def __init__(self, regions):
+        self.starts = array('l')
+        self.ends = array('l')
+
+        #shifts[i] is how far everything after the first i regions moves
+        self.shifts = array('l', [0])
+
+        for start, end, new_length in regions:
+            self.starts.append(start)
+            self.ends.append(end)
+            self.shifts.append(self.shifts[-1] + new_length - (end - start))
+
+    def map_line(self, line):
+        '''Return where the line of code numbered line (from 1, as astroid
+        counts) is moved to. Lines inside a replaced region move to its
+        start.'''
+        if line == UNKNOWN:
+            return line
+
+        position = bisect_right(self.ends, line - 1)
+
+        if position < len(self.starts) and self.starts[position] <= line - 1:
+            return self.starts[position] + self.shifts[position] + 1
+
+        return line + self.shifts[position]
+
+    def map_index(self, index):
+        '''Return where the character index is moved to, or UNKNOWN if it's in
+        or next to a replaced region, where only the new text can tell.'''
+        if index == UNKNOWN:
+            return index
+
+        position = bisect_left(self.ends, index)
+
+        if position < len(self.starts) and self.starts[position] <= index:
+            return UNKNOWN
+
+        return index + self.shifts[position]
+
+
+class SpanTable(object):
+    '''Position data for the nodes in one parse of a module, stored a column
+    at a time in arrays, which take far less memory than attributes on every
+    node. Each SourceNode holds the number of its row.
+
+    Rows are looked up by a node's locator -- its parent's row, and its
+    position among its parent's astroid children -- so a node built again from
+    the same parse gets the same row back, along with any character indices
+    already worked out for it.
+
+    The position columns hold line numbers and columns as astroid gives them
+    (lines starting from 1). The "inner" position is wherever the node's body
+    begins (see the SourceNode subclasses). The index columns hold character
+    indices into the module's source, filled in as they're needed.'''
+
+    POSITION_COLUMNS = (
+        'from_line',
+        'to_line',
+        'column',
+        'inner_line',
+        'inner_column',
+    )
+
+    INDEX_COLUMNS = (
+        'start_index',
+        'end_index',
+        'body_start_index',
+        'body_end_index',
+    )
+
+    __slots__ = POSITION_COLUMNS + INDEX_COLUMNS + ('_rows',)
+
+    def __init__(self):
+        for column_name in self.POSITION_COLUMNS + self.INDEX_COLUMNS:
+            setattr(self, column_name, array('l'))
+
+        #maps locators to row numbers
+        self._rows = {}
+
+    def __len__(self):
+        return len(self.from_line)
+
+    def get_row(self, locator, from_line, to_line, column):
+        '''Return the row number for the node at locator, adding a row with the
+        given position if there isn't one yet.'''
+
+        row = self._rows.get(locator)
+        if row is not None:
+            return row
+
+        row = len(self.from_line)
+        self._rows[locator] = row
+
+        self.from_line.append(from_line)
+        self.to_line.append(to_line)
+        self.column.append(column)
+
+        for column_name in ('inner_line', 'inner_column') + self.INDEX_COLUMNS:
+            getattr(self, column_name).append(UNKNOWN)
+
+        return row
+
+    def shift(self, line_map, index_map):
+        '''Move every position in the table to match the module's new source,
+        after whole lines of it were replaced without changing its syntax tree
+        (see ModuleNode.shift). line_map and index_map are ShiftMaps of the
+        replaced lines and characters. Columns don't change.'''
+
+        for column_name in ('from_line', 'to_line', 'inner_line'):
+            column = getattr(self, column_name)
+
+            for row, line in enumerate(column):
+                column[row] = line_map.map_line(line)
+
+        for column_name in self.INDEX_COLUMNS:
+            column = getattr(self, column_name)
+
+            for row, index in enumerate(column):
+                column[row] = index_map.map_index(index)
@@ -1,3 +1,5 @@
+from code_monkey.backend import DEFAULT_BACKEND
+from code_monkey.change import QueryChangeGenerator
 from code_monkey.node import (
     Node,
     ProjectNode,
@@ -10,15 +12,48 @@ from code_monkey.node import (
     AssignmentNode,
     ConstantNode)
 
-def project_query(project_path):
+def project_query(
+        project_path,
+        overlay=None,
+        include=None,
+        exclude=None,
+        gitignore=False,
+        ast_cache=None,
+        lite=False,
+        backend=DEFAULT_BACKEND):
     '''Take a filesystem path project_path, and return a NodeQuery containing
     a ProjectNode representing the Python project at that path.
 
     When working with a new project, this is usually the first thing you
-    should use.'''
+    should use.
+
+    If overlay (an uncommitted ChangeSet) is given, the project is read as if
+    overlay had been committed. To chain another pass of changes on top of it,
+    make them in a ChangeSet with overlay as its base.
+
+    include and exclude are lists of glob patterns for the files and
+    directories to search for modules, or to skip -- e.g. ['build/',
+    '*_pb2.py']. If gitignore is True, anything matched by the project's
+    .gitignore is skipped as well. See ModuleFilter for details.
+
+    ast_cache is the ASTCache to keep the project's syntax trees in; pass one
+    to change how many are kept in memory at once. If lite is True, nodes
+    don't hold on to their astroid objects (see SourceNode.is_lite).
+
+    backend chooses how modules are parsed: with 'astroid' (the default), or
+    with 'ast', which is several times faster and lighter, for queries that
+    don't need astroid's inference.'''
 
     return NodeQuery(
-        ProjectNode(project_path))
+        ProjectNode(
+            project_path,
+            overlay=overlay,
+            include=include,
+            exclude=exclude,
+            gitignore=gitignore,
+            ast_cache=ast_cache,
+            lite=lite,
+            backend=backend))
 
 class NodeQuery(object):
     '''A set of nodes, which can be filtered down to select nodes that match
@@ -54,6 +89,12 @@ class NodeQuery(object):
 
         return self._as_list
 
+    @property
+    def change(self):
+        '''A QueryChangeGenerator, for generating the same change to every node
+        in the query at once.'''
+        return QueryChangeGenerator(self)
+
     def join(self, *other_queries):
         '''Return a new query encompassing both this query and all parameter
         queries'''
@@ -192,8 +233,7 @@ class NodeQuery(object):
         filter_matches = set()
 
         for match in self:
-            if hasattr(match._astroid_object, 'basenames') and \
-                    find_me in match._astroid_object.basenames:
+            if find_me in getattr(match, 'basenames', ()):
                 filter_matches.add(match)
 
         return NodeQuery(filter_matches)
@@ -0,0 +1,194 @@
+'''A long-running server that keeps a project's tree in memory, and answers
+queries about it over a Unix domain socket, so that short-lived tools (editor
+plugins, commit hooks) don't have to read and parse the project every time
+they run. See code_monkey.client for the other end.
+
+The protocol is JSON, one object per line in each direction. A request
+describes a query as a list of NodeQuery method calls, made in order on a query
+containing the project, plus what to send back:
+
+    {"query": [["flatten"], ["classes"], ["path_contains", "tests"]],
+     "result": "paths"}
+
+"result" may be:
+    "paths": the path of every node in the query, sorted.
+    "sources": a list of [path, source] pairs, sorted by path.
+    "change": the changes generated by calling the QueryChangeGenerator method
+              named by "method" with "args" (a list) and "kwargs" (an
+              object of keyword arguments), as a patch (see
+              ChangeSet.write_patch).
+
+The response is {"result": ...}, or {"error": message} if the request failed.
+Before each request, the tree is brought up to date with any changes on disk
+(see DirectoryNode.refresh).
+'''
+import json
+import os
+import SocketServer
+from StringIO import StringIO
+from threading import Lock
+
+from code_monkey.node import ProjectNode
+from code_monkey.node_query import NodeQuery
+
+#the NodeQuery methods a request may call
+QUERY_METHODS = set([
+    'children',
+    'descendents',
+    'flatten',
+    'packages',
+    'modules',
+    'classes',
+    'functions',
+    'assignments',
+    'imports',
+    'constants',
+    'path_contains',
+    'source_contains',
+    'has_child',
+    'subclass_of_name',
+])
+
+#the QueryChangeGenerator methods a request may call
+CHANGE_METHODS = set([
+    'overwrite',
+    'overwrite_body',
+    'inject_at_index',
+    'inject_at_body_index',
+    'inject_at_line',
+    'inject_at_body_line',
+    'inject_before',
+    'inject_after',
+    'inject_assignment',
+    'value',
+])
+
+
+class RequestException(Exception):
+    '''Raised for a request the server can't answer.'''
+    pass
+
+
+def from_json(value):
+    '''Convert the unicode strings in value (as decoded by json) to str,
+    which is what code_monkey expects.'''
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+
+    if isinstance(value, list):
+        return [from_json(item) for item in value]
+
+    if isinstance(value, dict):
+        return dict(
+            (from_json(key), from_json(item)) for key, item in value.items())
+
+    return value
+
+
+def run_query(project, operations):
+    '''Return the NodeQuery made by applying operations (a list of
+    [method_name, arg, ...] lists) to a query containing project.'''
+
+    query = NodeQuery(project)
+
+    for operation in operations:
+        method_name, args = operation[0], from_json(operation[1:])
+
+        if not method_name in QUERY_METHODS:
+            raise RequestException(
+                "{} is not a query method".format(method_name))
+
+        query = getattr(query, method_name)(*args)
+
+    return query
+
+
+class QueryServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    '''Serves queries about the project at project_path on the Unix socket at
+    socket_path. Each connection gets its own thread, but requests are answered
+    one at a time, so the tree is never used by two requests at once.'''
+
+    daemon_threads = True
+
+    def __init__(self, project_path, socket_path, **project_options):
+        #project_options are passed on to ProjectNode (e.g. exclude)
+        self.project = ProjectNode(project_path, **project_options)
+        self._lock = Lock()
+
+        SocketServer.UnixStreamServer.__init__(
+            self,
+            socket_path,
+            QueryRequestHandler)
+
+    def handle_request_object(self, request):
+        '''Answer request (a decoded request object), and return the result.'''
+
+        with self._lock:
+            self.project.refresh()
+
+            return self._answer(request)
+
+    def _answer(self, request):
+        query = run_query(self.project, request.get('query', []))
+        result_type = request.get('result', 'paths')
+
+        if result_type == 'paths':
+            return sorted(node.path for node in query)
+
+        if result_type == 'sources':
+            return sorted([node.path, node.get_source()] for node in query)
+
+        if result_type == 'change':
+            method_name = request.get('method')
+
+            if not method_name in CHANGE_METHODS:
+                raise RequestException(
+                    "{} is not a change method".format(method_name))
+
+            changeset = getattr(query.change, method_name)(
+                *from_json(request.get('args', [])),
+                **from_json(request.get('kwargs', {})))
+
+            patch = StringIO()
+            changeset.write_patch(patch)
+            return patch.getvalue()
+
+        raise RequestException(
+            "{} is not a result type".format(result_type))
+
+    def server_close(self):
+        SocketServer.UnixStreamServer.server_close(self)
+
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+
+class QueryRequestHandler(SocketServer.StreamRequestHandler):
+    '''Reads requests from a connection, one per line, until the client
+    closes it.'''
+
+    def handle(self):
+        for line in iter(self.rfile.readline, ''):
+            try:
+                response = {
+                    'result': self.server.handle_request_object(
+                        json.loads(line))}
+            except Exception as e:
+                response = {'error': '{}: {}'.format(type(e).__name__, e)}
+
+            self.wfile.write(json.dumps(response) + '\n')
+            self.wfile.flush()
+
+
+def serve(project_path, socket_path, **project_options):
+    '''Serve queries about the project at project_path on socket_path until
+    interrupted.'''
+
+    server = QueryServer(project_path, socket_path, **project_options)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
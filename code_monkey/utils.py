@@ -1,56 +1,185 @@
 '''Utility functions used by other modules.'''
 import os
+from fnmatch import fnmatch
+from array import array
+from bisect import bisect_right
+
+#scandir reads the type of each directory entry along with its name, which
+#saves a stat per entry. It's in the standard library from Python 3.5, and
+#available for older versions as the scandir package.
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
 
 class InvalidEditException(Exception):
     pass
 
 
 class OverlapEditException(InvalidEditException):
-    def __init__(self, path, conflicting_changes):
+    def __init__(self, path, conflicting_changes, source=None):
+        #if we're given the source of the file, the changes don't need to read
+        #it themselves
         error_message = "Changes overlap: \n"
-        error_message += str(conflicting_changes[0])
+        error_message += conflicting_changes[0].diff(source)
         error_message += 'vs:\n'
-        error_message += str(conflicting_changes[1])
+        error_message += conflicting_changes[1].diff(source)
+
+        super(InvalidEditException, self).__init__(error_message)
+
+
+class StaleChangeException(InvalidEditException):
+    def __init__(self, path):
+        error_message = "{} has changed since its changes were made".format(
+            path)
 
         super(InvalidEditException, self).__init__(error_message)
 
 
 class TerminationNotFoundException(Exception):
-    def __init__(self, lines, start_column, start_line, terminating_char):
+    def __init__(self, source, start_line, start_column, terminating_char):
         error_message = "terminating character {} was not found\n".format(
             terminating_char)
         error_message += "scan started at {}, {} in source: {}".format(
-            start_column,
             start_line,
-            ''.join(lines))
+            start_column,
+            source)
 
         super(Exception, self).__init__(error_message)
 
 
-#snippet from: http://stackoverflow.com/questions/1151658/python-hashable-dicts
-class hashabledict(dict):
-  def __key(self):
-    return tuple((k,self[k]) for k in sorted(self))
-  def __hash__(self):
-    return hash(self.__key())
-  def __eq__(self, other):
-    return self.__key() == other.__key()
+def stat_file(fs_path):
+    '''Return the modification time, size, inode number, and status change time
+    of the file (or directory) at fs_path, or None if it doesn't exist.
+    Comparing two results is a cheap way to tell whether a file has changed.
+
+    The times are floats, as precise as the filesystem keeps them. The status
+    change time can't be set back (unlike the modification time, which tools
+    like cp -p and rsync restore), and replacing the file changes its inode.'''
+    try:
+        stat = os.stat(fs_path)
+    except OSError:
+        return None
+
+    return (stat.st_mtime, stat.st_size, stat.st_ino, stat.st_ctime)
+
+
+class ModuleFilter(object):
+    '''Decides which files and directories under root_path are searched for
+    Python modules.
+
+    Patterns are globs, as used by fnmatch. A pattern containing a slash is
+    matched against the path relative to root_path; any other pattern is
+    matched against the name of the file or directory alone. A pattern ending
+    in a slash only matches directories. So, for instance:
+    ['node_modules', 'build/', '*_pb2.py', 'docs/conf.py']
+
+    Args:
+        root_path (str): The directory relative paths are measured from.
+        include (list): If given, only modules matching one of these patterns
+                        are found. Directories are searched regardless.
+        exclude (list): Files and directories matching any of these patterns
+                        are skipped (excluded directories aren't searched).
+        gitignore (bool): If True, the patterns in root_path/.gitignore are
+                          excluded as well. Negated ('!') patterns aren't
+                          supported, and are ignored.'''
+
+    def __init__(self, root_path, include=None, exclude=None, gitignore=False):
+        self.root_path = root_path
+        self.include = list(include or [])
+        self.exclude = list(exclude or [])
+
+        if gitignore:
+            self.exclude.extend(read_gitignore(root_path))
+
+    def _matches(self, pattern, fs_path, name, is_dir):
+        if pattern.endswith('/'):
+            if not is_dir:
+                return False
+
+            pattern = pattern.rstrip('/')
+
+        if '/' in pattern:
+            return fnmatch(
+                os.path.relpath(fs_path, self.root_path),
+                pattern.lstrip('/'))
+
+        return fnmatch(name, pattern)
+
+    def allows(self, fs_path, name, is_dir):
+        '''Return whether the file or directory at fs_path (whose name is name)
+        should be searched for modules.'''
+
+        for pattern in self.exclude:
+            if self._matches(pattern, fs_path, name, is_dir):
+                return False
+
+        if is_dir or not self.include:
+            return True
+
+        for pattern in self.include:
+            if self._matches(pattern, fs_path, name, is_dir):
+                return True
+
+        return False
+
+
+def read_gitignore(root_path):
+    '''Return the patterns in root_path/.gitignore, or an empty list if there
+    isn't one.'''
+
+    try:
+        with open(os.path.join(root_path, '.gitignore')) as gitignore_file:
+            lines = gitignore_file.read().splitlines()
+    except IOError:
+        return []
+
+    return [
+        line.strip() for line in lines
+        if line.strip() and not line.startswith(('#', '!'))]
+
+
+def _list_directory(fs_path):
+    '''Yield a (name, full_path, is_dir) tuple for each entry in the directory
+    at fs_path.'''
+
+    if scandir is not None:
+        for entry in scandir(fs_path):
+            yield entry.name, entry.path, entry.is_dir()
+        return
+
+    for filename in os.listdir(fs_path):
+        full_path = os.path.join(fs_path, filename)
+        yield filename, full_path, os.path.isdir(full_path)
+
 
-def get_modules(fs_path):
+def get_modules(fs_path, module_filter=None):
     '''Find all Python modules in fs_path. Returns a list of tuples of the form:
-    (full_path, is_package)'''
+    (full_path, is_package)
+
+    If module_filter (a ModuleFilter) is given, only the files and directories
+    it allows are considered.'''
 
     modules = []
 
-    for filename in os.listdir(fs_path):
+    for filename, full_path, is_dir in _list_directory(fs_path):
 
-        full_path = os.path.join(fs_path, filename)
+        if not is_dir and not filename.endswith('.py'):
+            continue
 
-        if os.path.isdir(full_path) and '__init__.py' in os.listdir(full_path):
-            #directories with an __init__.py file are Python packages
-            modules.append((full_path, True))
+        if module_filter is not None and \
+                not module_filter.allows(full_path, filename, is_dir):
+            continue
 
-        elif filename.endswith('.py'):
+        if is_dir:
+            if os.path.isfile(os.path.join(full_path, '__init__.py')):
+                #directories with an __init__.py file are Python packages
+                modules.append((full_path, True))
+
+        else:
             #files ending in .py are assumed to be Python modules
             modules.append((full_path, False))
 
@@ -92,6 +221,48 @@ def line_column_to_absolute_index(text, line, column):
     return line_start_index + column
 
 
+class LineIndex(object):
+    '''The index of the start of every line in a string text. Build one once,
+    and it can convert between line/column positions and absolute indices
+    without scanning the text again.'''
+
+    def __init__(self, text):
+        self.text_length = len(text)
+
+        line_starts = array('l', [0])
+
+        newline_index = text.find('\n')
+        while newline_index != -1:
+            line_starts.append(newline_index + 1)
+            newline_index = text.find('\n', newline_index + 1)
+
+        self.line_starts = line_starts
+
+    @property
+    def newline_count(self):
+        '''The number of newlines in the text (see count_lines).'''
+        return len(self.line_starts) - 1
+
+    def line_column_to_index(self, line, column):
+        '''As line_column_to_absolute_index.'''
+
+        if line < 0:
+            raise ValueError("Negative line index {} is invalid.".format(
+                line))
+
+        if line >= len(self.line_starts):
+            raise ValueError(
+                "Asked for line {} (0-indexed), but string has only {} "
+                "lines".format(line, len(self.line_starts)))
+
+        return self.line_starts[line] + column
+
+    def index_to_line_column(self, index):
+        '''Return the 0-indexed line and column numbers of index.'''
+        line = bisect_right(self.line_starts, index) - 1
+        return (line, index - self.line_starts[line])
+
+
 def absolute_index_to_line_column(text, index):
     '''Given an index in a string text, return the corresponding 0-indexed line
     and column numbers.'''
@@ -108,70 +279,37 @@ def absolute_index_to_line_column(text, index):
     return (line_index, column)
 
 
-def find_termination(lines, start_line, start_column, terminating_char):
-    '''Walk back through lines starting from start_line, start_column, and
-    return the index at which terminating_char first appears, disregarding
-    anything on a line that is part of a comment. Again, the scan is BACKWARDS
-    -- so the result will be before start_line, start_column in the source file.
+def find_termination(
+        source,
+        line_index,
+        start_line,
+        start_column,
+        terminating_char):
+    '''Scan back through source from start_line, start_column (inclusive), and
+    return the absolute index just after the first terminating_char found.
+    Again, the scan is BACKWARDS -- so the result will be before start_line,
+    start_column in the source file. line_index is the LineIndex of source.
 
     Raises an exception if the terminating_char is not found.
 
+    source should have its strings and comments masked out (see
+    TokenTable.masked_source), so that only code is searched.
+
     The intended use is to find the end of a construct whose bounds are not
     necessaily determined by the placement of its children -- anything inside
     parentheses or brackets, where Python disregards whitespace.'''
 
-    #the last line to scan (remember, backwards!)
-    file_line_limit = 0
-
-    lines_to_scan = lines[file_line_limit:(start_line + 1)]
-
-    #trim the last line so that we don't include any of the sibling
-    lines_to_scan[-1] = lines_to_scan[-1][0:start_column+1]
-
-    #scan through the lines in reverse order, looking for the end of the node
+    scan_end = line_index.line_column_to_index(start_line, start_column) + 1
+    index = source.rfind(terminating_char, 0, scan_end)
 
-    #len(lines_to_scan) - (line_index + 1) is the index of a line in
-    #lines_to_scan -- basically, it takes us from the 'reversed' indices that we
-    #get in line_index back to real, from-the-beginning indices
-    for line_index, line in enumerate(reversed(lines_to_scan)):
-
-        #remove comments from line
-        if '#' in line:
-            line = line[0:line.find('#')]
-
-        for char_index, char in enumerate(reversed(line)):
-            if char == terminating_char:
-                line_index_in_file = file_line_limit + \
-                    len(lines_to_scan) - (line_index + 1)
-                char_index_in_line = len(line) - char_index
-                return line_column_to_absolute_index(
-                    ''.join(lines),
-                    line_index_in_file,
-                    char_index_in_line)
-
-    #we didn't find anything!
-    raise TerminationNotFoundException(
-        lines,
-        start_line,
-        start_column,
-        terminating_char)
-
-def safe_docstring(input):
-    '''Takes a docstring input, and returns a version with all ':' characters
-    replaced with ' '.
-
-    ':' characters will confuse the method we use to scan for the beginning of a
-    class or function body (basically, looking backwards from the first element
-    until we find the ':' from the signature), which is why we do this.
-
-    It's safe to sub in safe_docstring for docstring in a copy of the source,
-    because even if the docstring text appears elsewhere in the file, the
-    scanner won't hit it, and it will take up the same number of characters.
-
-    We could fool this by have a docstring whose text appears at the end of the
-    signature as well. Hopefully, that's a rare case, but: TODO: fix that.'''
+    if index == -1:
+        raise TerminationNotFoundException(
+            source,
+            start_line,
+            start_column,
+            terminating_char)
 
-    return input.replace(':', ' ')
+    return index + 1
 
 def count_lines(text):
     '''Return the number of lines in text.'''
@@ -37,7 +37,13 @@ setup(
 
     keywords='development code_generation static_analysis',
 
-    packages=['code_monkey'],
+    packages=find_packages(exclude=['tests', 'test_project*']),
+
+    entry_points={
+        'console_scripts': [
+            'code_monkey=code_monkey.cli:main',
+        ],
+    },
 
 
     install_requires=[
@@ -55,6 +61,10 @@ setup(
             'coverage==3.7.1',
             'nose==1.3.3',
         ],
+        #faster module discovery on Python < 3.5
+        'scandir': [
+            'scandir',
+        ],
         'dev': [
             'Sphinx==1.3.1',
             'sphinx-rtd-theme==0.1.8'
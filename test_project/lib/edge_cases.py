@@ -1,3 +1,4 @@
+# -*- coding: latin-1 -*-
 #multiline class signature
 import datetime
 
@@ -25,4 +26,18 @@ def send_memo(
 
 #uses dots (a 'getattr node') when specifying parent class
 class WeirdSubclass(datetime.datetime):
-    pass #WeirdSubclass body starts here
\ No newline at end of file
+    pass #WeirdSubclass body starts here
+
+#bodies that are only a docstring
+class DocstringOnlyError(Exception):
+    '''DocstringOnlyError body starts here'''
+
+def docstring_only():
+    '''docstring_only body starts here'''
+
+#constants made of more than one token
+NEGATIVE = -1
+CONCATENATED = ('con'
+    'catenated')
+
+#non-ASCII text, in the declared encoding: caf
@@ -0,0 +1,26 @@
+'''Fixtures shared by the tests that write to a copy of the test project.'''
+from os import path
+from shutil import copytree, rmtree
+
+TEST_PROJECT_PATH = path.join(
+    path.dirname(path.realpath(__file__)),
+    '../test_project')
+
+COPY_PATH = path.join(
+    path.dirname(path.realpath(__file__)),
+    '../test_project__copy')
+
+
+def setup_func():
+    #create a copy of the test_project folder
+    try:
+        copytree(TEST_PROJECT_PATH, COPY_PATH)
+    except OSError:
+        #if it's already there, delete it and re-copy
+        rmtree(COPY_PATH)
+        copytree(TEST_PROJECT_PATH, COPY_PATH)
+
+
+def teardown_func():
+    #remove the copied test_project folder
+    rmtree(COPY_PATH)
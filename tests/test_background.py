@@ -0,0 +1,33 @@
+from os import path
+
+from nose.tools import assert_equal, assert_true
+
+from code_monkey.background import aproject_query
+from code_monkey.node_query import project_query
+
+TEST_PROJECT_PATH = path.join(
+    path.dirname(path.realpath(__file__)),
+    '../test_project')
+
+
+def test_aproject_query():
+    '''Test that a query loaded in the background has every module parsed.'''
+
+    q = aproject_query(TEST_PROJECT_PATH).get(10)
+
+    modules = q.flatten().modules()
+    for module in modules:
+        assert_true(module.is_parsed)
+
+    assert_equal(
+        len(q.flatten()),
+        len(project_query(TEST_PROJECT_PATH).flatten()))
+
+
+def test_adiff():
+    '''Test that a diff made in the background matches one made directly.'''
+
+    classes = project_query(TEST_PROJECT_PATH).flatten().classes()
+    changeset = classes.change.inject_at_body_line(0, '    foobar = 42\n')
+
+    assert_equal(changeset.adiff().get(10), changeset.diff())
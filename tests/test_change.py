@@ -77,3 +77,23 @@ def test_inject_after():
     assert_in(
         "BASE_PAY = 100\n+foobar = \"baz\"",
         str(change))
+
+def test_query_change():
+    '''Test that a query's changes match those generated node by node.'''
+    classes = project_query(TEST_PROJECT_PATH).flatten().classes()
+
+    changeset = classes.change.inject_at_body_line(0, '    foobar = 42\n')
+
+    expected = set(
+        (change.path, change.start, change.end, change.new_text)
+        for change in [
+            node.change.inject_at_body_line(0, '    foobar = 42\n')
+            for node in classes])
+
+    actual = set(
+        (change.path, change.start, change.end, change.new_text)
+        for path in changeset.changes
+        for change in changeset.changes[path])
+
+    assert_equal(actual, expected)
+    assert_equal(len(actual), len(classes))
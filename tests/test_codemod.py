@@ -0,0 +1,87 @@
+import threading
+
+from nose.tools import assert_equal, assert_raises, with_setup
+
+from code_monkey.codemod import run_codemod, split_into_shards, stream_codemod
+from code_monkey.edit import ChangeSet
+from code_monkey.node import ProjectNode
+from tests.fixtures import (
+    COPY_PATH,
+    TEST_PROJECT_PATH,
+    setup_func,
+    teardown_func)
+
+
+def add_foobar(modules):
+    '''A transform that adds a line to the start of every class body.'''
+    changeset = ChangeSet()
+
+    for class_node in modules.flatten().classes():
+        changeset.add(
+            class_node.change.inject_at_body_line(0, '    foobar = 42\n'))
+
+    return changeset
+
+
+def test_shards():
+    '''Test that every module ends up in exactly one shard.'''
+    project = ProjectNode(TEST_PROJECT_PATH)
+    shards = split_into_shards(project, 2)
+
+    assert_equal(len(shards), 2)
+    assert_equal(
+        sorted(sum(shards, [])),
+        sorted(module.fs_path for module in project.iter_modules()))
+
+
+def test_run_codemod():
+    '''Test that a codemod gives the same results in one process or many.'''
+
+    single_process = run_codemod(TEST_PROJECT_PATH, add_foobar)
+    multi_process = run_codemod(TEST_PROJECT_PATH, add_foobar, jobs=2)
+
+    assert_equal(len(single_process.paths), 2)
+    assert_equal(single_process.paths, multi_process.paths)
+
+    for fs_path in single_process.paths:
+        assert_equal(
+            multi_process.get_changed_source_for_path(fs_path),
+            single_process.get_changed_source_for_path(fs_path))
+
+    with assert_raises(ValueError):
+        run_codemod(TEST_PROJECT_PATH, add_foobar, jobs=0)
+
+
+@with_setup(setup_func, teardown_func)
+def test_stream_codemod():
+    '''Test that streaming a codemod writes the same changes as running it all
+    at once.'''
+
+    changeset = run_codemod(COPY_PATH, add_foobar)
+    expected_sources = dict(
+        (fs_path, changeset.get_changed_source_for_path(fs_path))
+        for fs_path in changeset.paths)
+
+    written_paths = stream_codemod(COPY_PATH, add_foobar, prefetch=1)
+    assert_equal(sorted(written_paths), sorted(expected_sources.keys()))
+
+    for fs_path, expected_source in expected_sources.items():
+        with open(fs_path) as written_file:
+            assert_equal(written_file.read(), expected_source)
+
+
+def fail_transform(modules):
+    '''A transform that always raises.'''
+    raise ValueError('transform failed')
+
+
+@with_setup(setup_func, teardown_func)
+def test_stream_codemod_failure():
+    '''Test that the reader thread is stopped when a transform raises.'''
+
+    threads_before = threading.active_count()
+
+    with assert_raises(ValueError):
+        stream_codemod(COPY_PATH, fail_transform, prefetch=1)
+
+    assert_equal(threading.active_count(), threads_before)
@@ -0,0 +1,67 @@
+import difflib
+
+from nose.tools import assert_equal
+
+from code_monkey.change import Change
+from code_monkey.diff import get_windows, unified_diff
+
+#a long file with no repeated lines, so that every diff is unambiguous
+SOURCE = ''.join('line_{} = {}\n'.format(i, i) for i in range(200))
+
+
+def whole_file_diff(path, source, new_source):
+    return ''.join(difflib.unified_diff(
+        source.splitlines(True),
+        new_source.splitlines(True),
+        fromfile=path,
+        tofile=path))
+
+
+def line_index(line):
+    return SOURCE.find('line_{} ='.format(line))
+
+
+def test_matches_difflib():
+    '''Test that hunk-local diffs match a diff of the whole file.'''
+
+    changes = [
+        #overwrite part of a line
+        Change('foo.py', line_index(10), line_index(10) + 6, 'LINE_10'),
+        #insert whole lines
+        Change('foo.py', line_index(100), line_index(100), 'new = 1\n'),
+        #delete whole lines near the end of the file
+        Change('foo.py', line_index(197), line_index(199), ''),
+    ]
+
+    new_source = SOURCE
+    for change in reversed(changes):
+        new_source = (
+            new_source[:change.start] + change.new_text +
+            new_source[change.end:])
+
+    assert_equal(
+        unified_diff('foo.py', SOURCE, changes),
+        whole_file_diff('foo.py', SOURCE, new_source))
+
+
+def test_windows():
+    '''Test that changes close enough to share context are diffed together.'''
+
+    near = [
+        Change('foo.py', line_index(10), line_index(10), 'a = 1\n'),
+        Change('foo.py', line_index(16), line_index(16), 'b = 2\n'),
+    ]
+    assert_equal(len(get_windows(SOURCE, near)), 1)
+
+    far = [
+        Change('foo.py', line_index(10), line_index(10), 'a = 1\n'),
+        Change('foo.py', line_index(18), line_index(18), 'b = 2\n'),
+    ]
+    assert_equal(len(get_windows(SOURCE, far)), 2)
+
+
+def test_no_changes():
+    '''Test that a change which doesn't alter the source has an empty diff.'''
+
+    change = Change('foo.py', line_index(5), line_index(6), 'line_5 = 5\n')
+    assert_equal(unified_diff('foo.py', SOURCE, [change]), '')
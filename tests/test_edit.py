@@ -1,25 +1,30 @@
 '''Test changesets, diffs, and committing changes.'''
+import os
 from os import path
-from shutil import copytree, rmtree
+from StringIO import StringIO
 
 from nose.tools import (
     assert_equal,
+    assert_false,
+    assert_in,
+    assert_is,
     assert_is_instance,
+    assert_not_in,
     assert_raises,
+    assert_true,
     with_setup)
 
 from code_monkey.change import Change
 from code_monkey.node import ProjectNode
-from code_monkey.edit import ChangeSet
-from code_monkey.utils import OverlapEditException
-
-TEST_PROJECT_PATH = path.join(
-    path.dirname(path.realpath(__file__)),
-    '../test_project')
-
-COPY_PATH = path.join(
-    path.dirname(path.realpath(__file__)),
-    '../test_project__copy')
+from code_monkey.node.directory import ADDED, MODIFIED, REMOVED
+from code_monkey.edit import ChangeSet, SpillingChangeSet
+from code_monkey.node_query import project_query
+from code_monkey.utils import OverlapEditException, StaleChangeException
+from tests.fixtures import (
+    COPY_PATH,
+    TEST_PROJECT_PATH,
+    setup_func,
+    teardown_func)
 
 RESOURCES_PATH = path.join(
     path.dirname(path.realpath(__file__)),
@@ -45,15 +50,15 @@ EXPECTED_DIFF_STACKED = '''Changes:
 
 --- {0}
 +++ {0}
-@@ -2,6 +2,8 @@
- from test_project import settings
+@@ -3,6 +3,8 @@
  
  class Employee(object):
-+
-+    FIRST_INJECTED_VALUE = \'foo\'
  
++    FIRST_INJECTED_VALUE = \'foo\'
++
      def __init__(self, first_name, last_name):
          self.first_name = first_name
+         self.last_name = last_name
 @@ -14,6 +16,10 @@
  
  class CodeMonkey(Employee):
@@ -67,21 +72,6 @@ EXPECTED_DIFF_STACKED = '''Changes:
          self.is_up = False
 '''
 
-def setup_func():
-    #create a copy of the test_project folder
-    try:
-        copytree(TEST_PROJECT_PATH, COPY_PATH)
-    except OSError:
-        #if it's already there, delete it and re-copy
-        rmtree(COPY_PATH)
-        copytree(TEST_PROJECT_PATH, COPY_PATH)
-
-
-def teardown_func():
-    #remove the copied test_project folder
-    rmtree(COPY_PATH)
-
-
 #the decorator ensures that the setup/teardown happens for each test
 #we could also do this by making a test class with setUp/tearDown
 @with_setup(setup_func, teardown_func)
@@ -189,3 +179,364 @@ def test_conflicting_changes():
 
     with assert_raises(OverlapEditException):
         ChangeSet([change, second_change])
+
+
+def test_many_changes():
+    '''Test that changes added in any order are kept sorted, and that overlaps
+    are found among them.'''
+
+    settings_path = path.join(TEST_PROJECT_PATH, 'settings.py')
+
+    #every third character, added from the end of the file backwards, then
+    #the rest from the start
+    starts = range(147, 72, -3) + range(0, 75, 3)
+    changeset = ChangeSet([
+        Change(settings_path, start, start + 1, 'x') for start in starts])
+
+    assert_equal(
+        [change.start for change in changeset.get_sorted_changes(settings_path)],
+        range(0, 150, 3))
+
+    #a change that fits between two others is fine
+    changeset.add(Change(settings_path, 77, 77, 'y'))
+
+    for start, end in ((74, 76), (0, 2), (146, 148), (76, 80)):
+        with assert_raises(OverlapEditException):
+            changeset.add(Change(settings_path, start, end, 'z'))
+
+
+@with_setup(setup_func, teardown_func)
+def test_stale_changes():
+    '''Test that a ChangeSet works from its snapshot of a file, and refuses to
+    commit if the file has changed underneath it.'''
+
+    settings_path = path.join(COPY_PATH, 'settings.py')
+    with open(settings_path) as settings_file:
+        original_source = settings_file.read()
+
+    changeset = ChangeSet(Change(settings_path, 0, 0, 'foobar\n'))
+
+    with open(settings_path, 'a') as settings_file:
+        settings_file.write('SNUCK_IN = True\n')
+
+    assert_equal(
+        changeset.get_changed_source_for_path(settings_path),
+        'foobar\n' + original_source)
+
+    with assert_raises(StaleChangeException):
+        changeset.commit()
+
+    #nothing should have been written
+    with open(settings_path) as settings_file:
+        assert_equal(
+            settings_file.read(),
+            original_source + 'SNUCK_IN = True\n')
+
+    #without the source, the snapshot has to go back to the file
+    changeset = ChangeSet(
+        Change(settings_path, 0, 0, 'foobar\n'),
+        keep_sources=False)
+
+    with open(settings_path, 'w') as settings_file:
+        settings_file.write(original_source)
+
+    with assert_raises(StaleChangeException):
+        changeset.diff()
+
+    #an edit that keeps the file's size and modification time is still caught
+    #(the time is a whole second, so utime can set it back exactly)
+    os.utime(settings_path, (1000000000, 1000000000))
+    changeset = ChangeSet(Change(settings_path, 0, 0, 'foobar\n'))
+
+    with open(settings_path, 'w') as settings_file:
+        settings_file.write(original_source.swapcase())
+
+    os.utime(settings_path, (1000000000, 1000000000))
+
+    with assert_raises(StaleChangeException):
+        changeset.commit()
+
+
+@with_setup(setup_func, teardown_func)
+def test_overlay():
+    '''Test that a second pass of changes can be made against the uncommitted
+    results of the first, and committed along with them.'''
+
+    settings_path = path.join(COPY_PATH, 'settings.py')
+    with open(settings_path) as settings_file:
+        original_source = settings_file.read()
+
+    first_pass = ChangeSet(Change(settings_path, 0, 0, 'NEW_SETTING = 1\n'))
+
+    q = project_query(COPY_PATH, overlay=first_pass)
+    new_setting = q.flatten().assignments().path_contains('NEW_SETTING')[0]
+    assert_equal(new_setting.get_source(), 'NEW_SETTING = 1')
+
+    #nothing has been written yet
+    with open(settings_path) as settings_file:
+        assert_equal(settings_file.read(), original_source)
+
+    second_pass = ChangeSet(base=first_pass)
+    second_pass.add(new_setting.change.value(2))
+    second_pass.commit()
+
+    with open(settings_path) as settings_file:
+        assert_equal(
+            settings_file.read(),
+            'NEW_SETTING = 2\n' + original_source)
+
+
+@with_setup(setup_func, teardown_func)
+def test_overlay_without_base():
+    '''Test that changes made against an overlay are never applied to the file
+    on disk unless the overlay is their ChangeSet's base.'''
+
+    settings_path = path.join(COPY_PATH, 'settings.py')
+    first_pass = ChangeSet(Change(settings_path, 0, 0, 'NEW_SETTING = 1\n'))
+
+    q = project_query(COPY_PATH, overlay=first_pass)
+    settings_module = q.flatten().modules().path_contains('settings')[0]
+    base_pay = settings_module.children['BASE_PAY']
+
+    #the changes' positions are in the overlay's text, so that's what the
+    #ChangeSet takes as its snapshot
+    second_pass = ChangeSet(base_pay.change.value(200))
+    assert_is(second_pass.snapshots[settings_path], settings_module.snapshot)
+    assert_in('NEW_SETTING = 1', second_pass.get_source(settings_path))
+
+    with assert_raises(StaleChangeException):
+        second_pass.commit()
+
+    with open(settings_path) as settings_file:
+        assert_false('BASE_PAY = 200' in settings_file.read())
+
+
+@with_setup(setup_func, teardown_func)
+def test_rebase():
+    '''Test that after a commit, a project can re-parse only the modules that
+    changed.'''
+
+    project = ProjectNode(COPY_PATH)
+    settings_module = project.children['settings']
+    employee_module = project.children['lib'].children['employee']
+    old_setting = settings_module.children['ONE_LINER']
+
+    changeset = ChangeSet(
+        old_setting.change.inject_before('NEW_SETTING = 1\n'))
+    changeset.commit()
+
+    assert_equal(project.rebase(changeset), [settings_module])
+
+    #the tree is kept, and the changed module sees its new source
+    assert_is(project.children['settings'], settings_module)
+    assert_is(project.children['lib'].children['employee'], employee_module)
+    assert_equal(
+        settings_module.children['NEW_SETTING'].get_source(),
+        'NEW_SETTING = 1')
+
+    new_setting = settings_module.children['ONE_LINER']
+    assert_equal(new_setting.start_line, 1)
+
+    #nodes from before the commit are stale
+    assert_true(old_setting.is_stale)
+    assert_false(new_setting.is_stale)
+    assert_false(old_setting == new_setting)
+
+
+@with_setup(setup_func, teardown_func)
+def test_rebase_shift():
+    '''Test that modules whose changes only touch comments and blank lines keep
+    their nodes, shifted to their new positions, instead of being re-parsed.'''
+
+    project = ProjectNode(COPY_PATH)
+    settings_module = project.children['settings']
+    multiline_setting = settings_module.children['MULTILINE_SETTING']
+    base_pay = settings_module.children['BASE_PAY']
+    base_pay_source = base_pay.get_source()
+
+    #the first two blank lines inside MULTILINE_SETTING
+    blank_lines = settings_module.get_file_source_code().index(
+        '\n\n',
+        multiline_setting.start_index) + 1
+
+    changeset = ChangeSet([
+        Change(settings_module.fs_path, 0, 0, '#a header\n\n'),
+        Change(
+            settings_module.fs_path,
+            blank_lines,
+            blank_lines + 2,
+            '#no longer blank\n'),
+    ])
+    changeset.commit()
+
+    assert_equal(project.rebase(changeset), [])
+
+    assert_false(base_pay.is_stale)
+    assert_equal(base_pay.start_line, 14)
+    assert_equal(base_pay.get_source(), base_pay_source)
+    assert_equal(settings_module.children['BASE_PAY'].start_line, 14)
+    assert_equal(
+        multiline_setting.get_body_source(),
+        "{\n    'some_key': 42,\n    'other_key': {\n#no longer blank\n"
+        "        'baz': 'quux'\n    }  #some comment\n\n\n}")
+
+    #changes to code still need a re-parse
+    changeset = ChangeSet(base_pay.change.value(200))
+    changeset.commit()
+
+    assert_equal(project.rebase(changeset), [settings_module])
+    assert_true(base_pay.is_stale)
+
+
+@with_setup(setup_func, teardown_func)
+def test_refresh():
+    '''Test that refreshing a project picks up added, removed, and modified
+    modules.'''
+
+    project = ProjectNode(COPY_PATH)
+    settings_module = project.children['settings']
+    settings_module.get_file_source_code()
+    project.children['lib'].children
+
+    with open(path.join(COPY_PATH, 'settings.py'), 'a') as settings_file:
+        settings_file.write('\nNEW_SETTING = 1\n')
+
+    with open(path.join(COPY_PATH, 'new_module.py'), 'w') as new_file:
+        new_file.write('NEW_MODULE = True\n')
+
+    os.remove(path.join(COPY_PATH, 'lib', 'edge_cases.py'))
+
+    assert_equal(sorted(project.refresh()), [
+        (ADDED, path.join(COPY_PATH, 'new_module.py')),
+        (MODIFIED, path.join(COPY_PATH, 'settings.py')),
+        (REMOVED, path.join(COPY_PATH, 'lib', 'edge_cases.py')),
+    ])
+
+    assert_in('NEW_SETTING', settings_module.children)
+    assert_in('new_module', project.children)
+    assert_not_in('edge_cases', project.children['lib'].children)
+
+    assert_equal(project.refresh(), [])
+
+
+@with_setup(setup_func, teardown_func)
+def test_spilling_changeset():
+    '''Test that a SpillingChangeSet behaves like a ChangeSet, even when all
+    of its changes have been written out to disk.'''
+
+    settings_path = path.join(COPY_PATH, 'settings.py')
+
+    changes = [
+        Change(settings_path, 0, 0, 'foobar\n'),
+        Change(settings_path, 20, 20, 'baz\n'),
+    ]
+
+    changeset = ChangeSet(changes)
+    spilling_changeset = SpillingChangeSet(changes, spill_threshold=0)
+
+    assert_equal(spilling_changeset.changes[settings_path], [])
+    assert_equal(spilling_changeset.diff(), changeset.diff())
+
+    spilling_changeset.commit()
+    assert_equal(spilling_changeset.spill_directory, None)
+
+    with open(settings_path) as settings_file:
+        assert_equal(
+            settings_file.read(),
+            changeset.get_changed_source_for_path(settings_path))
+
+    #overlaps with changes that have been spilled are caught when the changes
+    #are read back
+    spilling_changeset = SpillingChangeSet(
+        Change(settings_path, 0, 10, 'foo'),
+        spill_threshold=0)
+    spilling_changeset.add(Change(settings_path, 5, 15, 'bar'))
+
+    with assert_raises(OverlapEditException):
+        spilling_changeset.diff()
+
+    spilling_changeset.close()
+
+    #and before commit() writes anything, even to other files
+    employee_path = path.join(COPY_PATH, 'lib', 'employee.py')
+    with open(employee_path) as employee_file:
+        employee_source = employee_file.read()
+
+    spilling_changeset = SpillingChangeSet(
+        [
+            Change(employee_path, 0, 0, 'foo\n'),
+            Change(settings_path, 0, 10, 'foo'),
+        ],
+        spill_threshold=1)
+    spilling_changeset.add(Change(settings_path, 5, 15, 'bar'))
+
+    with assert_raises(OverlapEditException):
+        spilling_changeset.commit()
+
+    with open(employee_path) as employee_file:
+        assert_equal(employee_file.read(), employee_source)
+
+    #a failed commit still removes the spilled changes
+    assert_equal(spilling_changeset.spill_directory, None)
+
+
+@with_setup(setup_func, teardown_func)
+def test_patch_round_trip():
+    '''Test that a ChangeSet can be written to a patch, then read back and
+    committed somewhere else.'''
+
+    settings_path = path.join(COPY_PATH, 'settings.py')
+
+    changeset = ChangeSet([
+        Change(settings_path, 0, 0, 'foobar\n'),
+        Change(settings_path, 20, 20, "'\xc3\xa9'\n"),
+        #not UTF-8 (latin-1, say)
+        Change(settings_path, 40, 40, '# caf\xe9\n'),
+    ])
+    layered_changeset = ChangeSet(
+        Change(settings_path, 0, 6, 'FOOBAR'),
+        base=changeset)
+
+    patch = StringIO()
+    layered_changeset.write_patch(patch)
+    patch.seek(0)
+
+    read_changeset = ChangeSet.read_patch(patch)
+    assert_equal(read_changeset.diff(), layered_changeset.diff())
+    assert_equal(read_changeset.base.diff(), changeset.diff())
+    assert_equal(
+        [change.new_text
+            for change in read_changeset.base.get_sorted_changes(settings_path)],
+        ['foobar\n', "'\xc3\xa9'\n", '# caf\xe9\n'])
+
+    expected_source = layered_changeset.get_changed_source_for_path(
+        settings_path)
+    read_changeset.commit()
+
+    with open(settings_path) as settings_file:
+        assert_equal(settings_file.read(), expected_source)
+
+    #the file has changed since the patch was made, so it can't be applied
+    patch.seek(0)
+    with assert_raises(StaleChangeException):
+        ChangeSet.read_patch(patch).commit()
+
+
+@with_setup(setup_func, teardown_func)
+def test_skip_unchanged():
+    '''Test that commit doesn't rewrite files whose source hasn't changed.'''
+
+    settings_path = path.join(COPY_PATH, 'settings.py')
+    employee_path = path.join(COPY_PATH, 'lib', 'employee.py')
+
+    with open(settings_path) as settings_file:
+        first_line = settings_file.readline()
+
+    changeset = ChangeSet([
+        #overwrite a line with itself
+        Change(settings_path, 0, len(first_line), first_line),
+        Change(employee_path, 0, 0, '#foobar\n'),
+    ])
+
+    assert_equal(changeset.commit(), [employee_path])
+    assert_equal(changeset.written_paths, [employee_path])
@@ -3,6 +3,7 @@ from nose.tools import assert_equal, assert_raises
 from code_monkey.end_detection import (
     EndDetector,
     DetectorLockedError,
+    TokenTable,
     get_tokens)
 
 def find_end(node_type, source, start_from=0, child_tokens={}):
@@ -53,3 +54,47 @@ def test_locking():
     with assert_raises(DetectorLockedError):
         detector.consume_anything()
 
+
+def test_tokens():
+    '''Test that tokens can be read by field name, as attributes or with [].'''
+    token = get_tokens('my_func(42)\n')[2]
+
+    assert_equal(token.token, '42')
+    assert_equal(token['token'], '42')
+    assert_equal(token['start'], (0, 8))
+    assert_equal(token['end'], token.end)
+
+    #a long line of constants, with the one we want at the end
+    source = ', '.join(['1'] * 10000) + ', 42\n'
+    assert_equal(find_end('constant', source, len(source) - 3), len(source) - 1)
+
+def test_expression():
+    '''Test that consume_expression finds the end of expressions of any kind.'''
+    assert_equal(find_end('expression', 'a.b.c(1, d=[2])[3:4] + 5 # hi\n'),
+        len('a.b.c(1, d=[2])[3:4] + 5'))
+    assert_equal(find_end('expression', 'x and not (y or\n    z)\n'),
+        len('x and not (y or\n    z)'))
+    assert_equal(find_end('expression', 'lambda a, b: a if b else {}\n'),
+        len('lambda a, b: a if b else {}'))
+    assert_equal(find_end('expression', '[i for i in {\n1: 2, # hi\n}]\n'),
+        len('[i for i in {\n1: 2, # hi\n}]'))
+
+    #an expression ends at a comma or a bracket it didn't open
+    assert_equal(find_end('expression', 'f(a + b, c)\n', 2), len('f(a + b'))
+    assert_equal(find_end('expression', 'f(a + b)\n', 2), len('f(a + b'))
+
+    #unless it's allowed to be a tuple
+    detector = EndDetector('1, 2; x = 3\n')
+    detector.consume_expression(allow_tuple=True)
+    assert_equal(detector.get_end_index(detector.last_consumed), len('1, 2'))
+
+def test_masked_source():
+    '''Test that masked_source blanks out strings and comments, keeping every
+    other character where it was.'''
+    source = "def f(a=':'): #b: c\n    '''d:\ne'''\n"
+    masked_source = TokenTable(source).masked_source
+
+    assert_equal(
+        masked_source,
+        'def f(a=   ):' + ' ' * 6 + '\n' + ' ' * 9 + '\n' + ' ' * 4 + '\n')
+    assert_equal(masked_source.rfind(':'), source.find('):') + 1)
@@ -1,13 +1,24 @@
 from os import path
 
-from nose.tools import assert_equal, assert_is_instance
-
+from nose.tools import (
+    assert_equal,
+    assert_false,
+    assert_is,
+    assert_is_instance,
+    assert_is_none,
+    assert_true)
+
+from code_monkey.ast_cache import ASTCache
+from code_monkey.backend.astroid_backend import get_encoding
 from code_monkey.node import (
     ClassNode,
+    FunctionNode,
     ModuleNode,
     PackageNode,
     ProjectNode,
     AssignmentNode)
+from code_monkey.node.source import SourceNode
+from code_monkey.node_query import NodeQuery
 
 TEST_PROJECT_PATH = path.join(
     path.dirname(path.realpath(__file__)),
@@ -143,6 +154,149 @@ def test_equality():
     new_project = ProjectNode(TEST_PROJECT_PATH)
     assert_equal(new_project.children['lib'], package)
 
+def test_hashing():
+    '''Test that equal nodes from different copies of the project hash the
+    same, so that sets of nodes hold each of them once.'''
+    new_project = ProjectNode(TEST_PROJECT_PATH)
+    new_var = new_project.children['settings'].children['MULTILINE_SETTING']
+
+    assert_equal(hash(new_var), hash(module_var))
+    assert_equal(len(set([new_var, module_var, employee_class])), 2)
+
+    assert_false(new_var != module_var)
+    assert_true(employee_class != module_var)
+
+def test_docstring_only_body():
+    '''Test that classes and functions whose body is only a docstring can be
+    built, and that their body starts with the docstring.'''
+    edge_cases = package.children['edge_cases']
+
+    for name in ('DocstringOnlyError', 'docstring_only'):
+        node = edge_cases.children[name]
+
+        assert_equal(
+            node.body_start_index,
+            node.get_file_source_code().find(
+                "    '''{} body starts here".format(name)))
+        assert_equal(node.inner_indentation, '    ')
+
+def test_declared_encoding():
+    '''Test that modules with non-ASCII text in the encoding they declare
+    are parsed.'''
+    edge_cases = package.children['edge_cases']
+    source = edge_cases.get_file_source_code()
+
+    assert_equal(get_encoding(source), 'latin-1')
+    assert_true('caf\xe9' in source)
+    assert_is_instance(edge_cases.children['Lair'], ClassNode)
+
+def test_ast_cache_eviction():
+    '''Test that modules whose trees are evicted from the AST cache are parsed
+    again when they're needed.'''
+
+    small_project = ProjectNode(TEST_PROJECT_PATH, ast_cache=ASTCache(1))
+    settings_module = small_project.children['settings']
+    employee_module = small_project.children['lib'].children['employee']
+
+    one_liner = settings_module.children['ONE_LINER']
+    employee_module.children
+
+    #only the most recently parsed module is kept...
+    assert_equal(len(small_project.ast_cache), 1)
+    assert_false(settings_module.is_parsed)
+
+    #...but the other can still be used, and its nodes are still current
+    assert_equal(
+        settings_module.children['ONE_LINER'].get_source(),
+        "ONE_LINER = 'foobar'")
+    assert_false(one_liner.is_stale)
+
+
+def test_span_table():
+    '''Test that nodes keep their positions in their module's SpanTable,
+    rather than in attributes of their own.'''
+
+    for node in (project, package, employee_module, employee_class):
+        assert_false(hasattr(node, '__dict__'))
+
+    span_table = employee_module.span_table
+    start_index = employee_class.start_index
+    table_size = len(span_table)
+
+    #nodes built again from the same parse get their old rows back, along
+    #with the indices already worked out for them
+    employee_module._children = None
+    rebuilt_class = employee_module.children['Employee']
+
+    assert_equal(len(span_table), table_size)
+    assert_equal(rebuilt_class._span_row, employee_class._span_row)
+    assert_equal(
+        span_table.start_index[rebuilt_class._span_row],
+        start_index)
+
+
+def test_ast_backend():
+    '''Test that the ast backend builds the same tree as astroid.'''
+
+    nodes = NodeQuery(project).flatten()
+    ast_nodes = NodeQuery(ProjectNode(
+        TEST_PROJECT_PATH,
+        backend='ast')).flatten()
+
+    assert_equal(
+        sorted((node.__class__, node.path) for node in ast_nodes),
+        sorted((node.__class__, node.path) for node in nodes))
+
+    spans = {}
+    for node in nodes:
+        if isinstance(node, (ClassNode, FunctionNode, AssignmentNode)):
+            spans[node.path] = (
+                node.start_line,
+                node.start_column,
+                node.get_source(),
+                node.get_body_source())
+
+    for node in ast_nodes:
+        if node.path in spans:
+            assert_equal(
+                (
+                    node.start_line,
+                    node.start_column,
+                    node.get_source(),
+                    node.get_body_source()),
+                spans[node.path])
+
+    ast_class = ast_nodes.classes().path_contains('CodeMonkey')[0]
+    assert_equal(ast_class.basenames, ['Employee'])
+
+
+def test_lite_tree():
+    '''Test that a lite tree matches a normal one, without holding on to any
+    astroid objects.'''
+
+    lite_nodes = NodeQuery(ProjectNode(TEST_PROJECT_PATH, lite=True)).flatten()
+    nodes = NodeQuery(ProjectNode(TEST_PROJECT_PATH)).flatten()
+
+    assert_equal(len(lite_nodes), len(nodes))
+
+    lite_sources = {}
+    for node in lite_nodes:
+        if isinstance(node, SourceNode) and not isinstance(node, ModuleNode):
+            assert_is_none(node._astroid_node)
+
+        if isinstance(node, (ClassNode, FunctionNode, AssignmentNode)):
+            lite_sources[node.path] = node.get_source()
+
+    for node in nodes:
+        if node.path in lite_sources:
+            assert_equal(lite_sources[node.path], node.get_source())
+
+    #astroid objects can still be found again when they're needed
+    lite_class = lite_nodes.classes().path_contains('CodeMonkey')[0]
+    assert_equal(lite_class._astroid_object.name, 'CodeMonkey')
+    assert_equal(lite_class.basenames, ['Employee'])
+
+
 def test_constants_source():
     '''Test that ConstantNodes can identify their own source.'''
 
@@ -155,6 +309,15 @@ def test_constants_source():
 
     assert_equal(int_node.get_source(), '100')
 
+    #constants that take more than one token
+    edge_cases = package.children['edge_cases']
+    negative_node = edge_cases.children['NEGATIVE'].children['constant']
+    concatenated_node = \
+        edge_cases.children['CONCATENATED'].children['constant']
+
+    assert_equal(negative_node.get_source(), '-1')
+    assert_equal(concatenated_node.get_source(), "'con'\n    'catenated'")
+
 
 def test_names_source():
     '''Test that NameNodes can identify their source.'''
@@ -163,3 +326,29 @@ def test_names_source():
 
     aname_node = root_module.children['MANAGER_PAY'].children['MANAGER_PAY']
     assert_equal(aname_node.get_source(), 'MANAGER_PAY')
+
+
+def test_multiline_names_source():
+    '''Test that NameNodes in multi-line statements can identify their source,
+    using the module's shared TokenTable.'''
+    name_node = module_var.children['MULTILINE_SETTING']
+
+    assert_equal(name_node.get_source(), 'MULTILINE_SETTING')
+    assert_equal(name_node.end_line, 2)
+    assert_equal(name_node.end_column, len('MULTILINE_SETTING'))
+
+    #the module is only tokenized once
+    token_table = root_module.token_table
+    root_module.children['BASE_PAY'].children['constant'].get_source()
+    assert_is(root_module.token_table, token_table)
+
+def test_last_line_variable_source():
+    '''Test that a variable on the last line of a file (with no newline after
+    it) keeps the whole of its value.'''
+    manager_pay = root_module.children['MANAGER_PAY']
+
+    assert_equal(manager_pay.get_source(), 'MANAGER_PAY = BASE_PAY')
+    assert_equal(manager_pay.get_body_source(), 'BASE_PAY')
+    assert_equal(
+        (manager_pay.end_line, manager_pay.end_column),
+        (14, len('MANAGER_PAY = BASE_PAY')))
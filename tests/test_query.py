@@ -10,7 +10,7 @@ from code_monkey.node import (
     PackageNode,
     ProjectNode,
     AssignmentNode)
-from code_monkey.node_query import NodeQuery
+from code_monkey.node_query import NodeQuery, project_query
 
 TEST_PROJECT_PATH = path.join(
     path.dirname(path.realpath(__file__)),
@@ -28,7 +28,7 @@ def test_descent():
     assert_equal(len(q.children()), len(q[0].children))
 
     #the number of nodes in the whole project tree, including the root
-    assert_equal(len(q.flatten()), 51)
+    assert_equal(len(q.flatten()), 60)
 
 
 def test_type_filters():
@@ -87,3 +87,27 @@ def test_constant():
 
     assert_equal(constants.path_contains('ONE_LINER')[0].value_type, 'str')
     assert_equal(constants.path_contains('BASE_PAY')[0].value_type, 'int')
+
+
+def test_include_exclude():
+    '''Test that include and exclude patterns limit which modules are
+    found.'''
+
+    def module_paths(query):
+        return sorted(module.path for module in query.flatten().modules())
+
+    excluded = project_query(
+        TEST_PROJECT_PATH,
+        exclude=['edge_cases.py', '__init__.py'])
+    assert_equal(module_paths(excluded), [
+        'test_project.lib.employee',
+        'test_project.settings'])
+
+    #excluded directories aren't searched at all
+    no_lib = project_query(TEST_PROJECT_PATH, exclude=['lib/'])
+    assert_equal(len(no_lib.flatten().packages()), 0)
+
+    included = project_query(TEST_PROJECT_PATH, include=['lib/e*.py'])
+    assert_equal(module_paths(included), [
+        'test_project.lib.edge_cases',
+        'test_project.lib.employee'])
@@ -0,0 +1,82 @@
+import os
+import tempfile
+from os import path
+from threading import Thread
+
+from nose.tools import assert_equal, assert_raises, assert_true
+
+from code_monkey.client import ServerException, remote_query
+from code_monkey.node_query import project_query
+from code_monkey.server import QueryServer
+
+TEST_PROJECT_PATH = path.join(
+    path.dirname(path.realpath(__file__)),
+    '../test_project')
+
+server = None
+
+
+def setup_module():
+    global server
+
+    socket_path = path.join(tempfile.mkdtemp(), 'code_monkey.sock')
+    server = QueryServer(TEST_PROJECT_PATH, socket_path)
+
+    thread = Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+
+def teardown_module():
+    server.shutdown()
+    server.server_close()
+    os.rmdir(path.dirname(server.server_address))
+
+
+def test_remote_query():
+    '''Test that a remote query gives the same results as a local one.'''
+
+    remote_classes = remote_query(server.server_address).flatten().classes()
+    local_classes = project_query(TEST_PROJECT_PATH).flatten().classes()
+
+    assert_equal(
+        remote_classes.paths(),
+        sorted(node.path for node in local_classes))
+
+    remote_changeset = remote_classes.change.inject_at_body_line(
+        0, '    foobar = 42\n')
+    local_changeset = local_classes.change.inject_at_body_line(
+        0, '    foobar = 42\n')
+
+    assert_equal(remote_changeset.diff(), local_changeset.diff())
+
+    remote_classes.connection.close()
+
+
+def test_remote_change_options():
+    '''Test that keyword options of change methods reach the server.'''
+
+    remote_classes = remote_query(server.server_address).flatten(
+        ).classes().path_contains('CodeMonkey')
+    local_classes = project_query(TEST_PROJECT_PATH).flatten(
+        ).classes().path_contains('CodeMonkey')
+
+    options = {'extra_trailing_newline': True, 'convert_value': False}
+    remote_changeset = remote_classes.change.inject_assignment(
+        'FOO', 'dict(a=1)', **options)
+    local_changeset = local_classes.change.inject_assignment(
+        'FOO', 'dict(a=1)', **options)
+
+    assert_equal(remote_changeset.diff(), local_changeset.diff())
+    assert_true('FOO = dict(a=1)' in remote_changeset.diff())
+
+    remote_classes.connection.close()
+
+
+def test_bad_request():
+    '''Test that the server reports requests it can't answer.'''
+
+    query = remote_query(server.server_address)._then('__init__')
+    assert_raises(ServerException, query.paths)
+
+    query.connection.close()
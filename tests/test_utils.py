@@ -1,8 +1,12 @@
 from os import path
 
-from nose.tools import assert_equal
+from nose.tools import assert_equal, assert_raises
 
-from code_monkey.utils import line_column_to_absolute_index
+from code_monkey.utils import (
+    LineIndex,
+    TerminationNotFoundException,
+    find_termination,
+    line_column_to_absolute_index)
 
 TEST_PROJECT_PATH = path.join(
     path.dirname(path.realpath(__file__)),
@@ -24,3 +28,38 @@ def test_line_column_to_absolute_index():
         assert_equal(
             line_column_to_absolute_index(source, 1, 0),
             21)
+
+
+def test_line_index():
+    '''Test that a LineIndex agrees with line_column_to_absolute_index.'''
+
+    with open(path.join(TEST_PROJECT_PATH, 'settings.py')) as source_file:
+        source = source_file.read()
+
+    line_index = LineIndex(source)
+
+    for line in range(source.count('\n') + 1):
+        index = line_column_to_absolute_index(source, line, 0)
+
+        assert_equal(line_index.line_column_to_index(line, 0), index)
+        assert_equal(line_index.index_to_line_column(index), (line, 0))
+
+
+def test_find_termination():
+    '''Test that find_termination scans backwards from a position (including
+    the character at it) and gives the index just after what it finds.'''
+    source = 'def f(a,\n      b):\n    pass\n'
+    line_index = LineIndex(source)
+
+    assert_equal(
+        find_termination(source, line_index, 2, 4, ':'),
+        source.find(':') + 1)
+    assert_equal(
+        find_termination(source, line_index, 1, 8, ':'),
+        source.find(':') + 1)
+    assert_equal(
+        find_termination(source, line_index, 1, 6, ','),
+        source.find(',') + 1)
+
+    with assert_raises(TerminationNotFoundException):
+        find_termination(source, line_index, 1, 7, ':')